@@ -1,23 +1,77 @@
 import os
-import json
-import uuid
+import atexit
+import threading
+import queue
+import orjson
+import secrets
+import hashlib
+import string
 import datetime
-from typing import Dict, Any, Optional, List
-from functools import wraps
+import time
+from typing import Dict, Any, Optional, List, Tuple
+from functools import wraps, lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
 from flask import session
 from PIL import Image
 import tempfile
+import shutil
 from docx.shared import Inches
 
 import requests
-from flask import Flask, request, redirect, url_for, jsonify, render_template, abort, send_file
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, request, redirect, url_for, jsonify, render_template, stream_with_context, abort, send_file
 
 import zipfile
-from io import BytesIO
+from io import BytesIO, UnsupportedOperation
+from xml.sax.saxutils import escape as xml_escape
 from docx import Document
+from docx.oxml.ns import qn
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify / request.get_json via orjson (repli sur le provider Flask pour les types non gérés)."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        # ✅ corps de réponse = octets orjson directement (pas de str intermédiaire ré-encodée)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+
+def request_json() -> Dict[str, Any]:
+    """
+    Corps JSON de la requête (objet) ; {} si vide, invalide, pas un objet ou pas envoyé en application/json.
+    Le Content-Type JSON impose un preflight CORS : un formulaire d'un autre site (text/plain) ne passe pas.
+    (navigator.sendBeacon de la fiche stagiaire envoie un Blob typé application/json.)
+    """
+    if not request.is_json:
+        return {}
+    try:
+        payload = orjson.loads(request.get_data(cache=False) or b"{}")
+    except orjson.JSONDecodeError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
 
 # =========================
 # Auth (admin)
@@ -44,17 +98,14 @@ def admin_login_required(view):
         return view(*args, **kwargs)
     return wrapped
 
-@app.get("/admin/login")
-def admin_login():
-    # mini page sans template (pour aller vite)
-    next_url = request.args.get("next") or url_for("admin_sessions")
-    return f"""
+# mini page sans template (pour aller vite) : compilée une seule fois au démarrage
+_ADMIN_LOGIN_TEMPLATE = app.jinja_env.from_string("""
     <!doctype html><html lang="fr"><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
     <title>Connexion admin</title></head>
     <body style="font-family:Arial,sans-serif;max-width:420px;margin:60px auto;padding:20px">
       <h2>Connexion</h2>
       <form method="post" action="/admin/login">
-        <input type="hidden" name="next" value="{next_url}">
+        <input type="hidden" name="next" value="{{ next_url }}">
         <div style="margin:10px 0">
           <label>Identifiant</label><br>
           <input name="username" autocomplete="username" style="width:100%;padding:10px">
@@ -66,7 +117,13 @@ def admin_login():
         <button style="padding:10px 14px">Se connecter</button>
       </form>
     </body></html>
-    """
+    """)
+
+
+@app.get("/admin/login")
+def admin_login():
+    next_url = request.args.get("next") or url_for("admin_sessions")
+    return _ADMIN_LOGIN_TEMPLATE.render(next_url=next_url)
 
 @app.post("/admin/login")
 def admin_login_post():
@@ -128,6 +185,13 @@ DATA_FILE = os.path.join(PERSIST_DIR, "data.json")
 UPLOADS_DIR = os.path.join(PERSIST_DIR, "uploads")
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+# ✅ Jinja : pas de stat() des templates à chaque rendu + bytecode conservé entre redémarrages
+JINJA_CACHE_DIR = os.path.join(PERSIST_DIR, "jinja_cache")
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_env.auto_reload = False
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory=JINJA_CACHE_DIR)
+
 def trainee_upload_dir(session_id: str, trainee_id: str) -> str:
     d = os.path.join(UPLOADS_DIR, session_id, trainee_id)
     os.makedirs(d, exist_ok=True)
@@ -141,6 +205,8 @@ BREVO_API_KEY = os.environ.get("BREVO_API_KEY", "")
 BREVO_SENDER_EMAIL = os.environ.get("BREVO_SENDER_EMAIL", "ecole@integraleacademy.com")
 BREVO_SENDER_NAME = os.environ.get("BREVO_SENDER_NAME", "Intégrale Academy")
 CNAPS_LOOKUP_ENDPOINT = os.environ.get("CNAPS_LOOKUP_ENDPOINT", "")
+# optionnel : endpoint POST acceptant une liste [{"nom","prenom"}] (un seul appel pour toute la session)
+CNAPS_BULK_LOOKUP_ENDPOINT = os.environ.get("CNAPS_BULK_LOOKUP_ENDPOINT", "")
 
 PUBLIC_STUDENT_PORTAL_BASE = os.environ.get(
     "PUBLIC_STUDENT_PORTAL_BASE",
@@ -173,16 +239,46 @@ def normalize_phone_fr(phone: str) -> str:
 
 import base64
 
+# ✅ Sessions HTTP partagées : connexions keep-alive réutilisées
+# (Retry ne rejoue que les GET par défaut : pas de double envoi email/SMS)
+def _pooled_session(headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    sess = requests.Session()
+    if headers:
+        sess.headers.update(headers)
+    sess.mount("https://", HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504]),
+    ))
+    return sess
+
+
+# CNAPS / hébergement
+_HTTP = _pooled_session()
+
+# ✅ session dédiée Brevo : en-têtes (api-key) posés une fois, jamais envoyés aux autres services
+# (corps envoyés en octets orjson : data=orjson.dumps(payload), content-type déjà posé ici)
+_BREVO_HTTP = _pooled_session({
+    "accept": "application/json",
+    "api-key": BREVO_API_KEY,
+    "content-type": "application/json",
+})
+
+
+BREVO_OK_STATUSES = (200, 201, 202)
+BREVO_NOT_CALLED = 0  # clé API ou destinataire manquant : aucun appel Brevo
+
+
 def brevo_send_email(to_email: str, subject: str, html: str) -> bool:
+    return _brevo_email_status(to_email, subject, html) in BREVO_OK_STATUSES
+
+
+def _brevo_email_status(to_email: str, subject: str, html: str) -> Optional[int]:
+    """Code HTTP Brevo, BREVO_NOT_CALLED, ou None si la réponse n'est pas arrivée (timeout, réseau)."""
     if not BREVO_API_KEY or not to_email:
-        return False
+        return BREVO_NOT_CALLED
 
     url = "https://api.brevo.com/v3/smtp/email"
-    headers = {
-        "accept": "application/json",
-        "api-key": BREVO_API_KEY,
-        "content-type": "application/json",
-    }
 
     attachments = []  # ✅ pas d'inline CID, Gmail casse souvent
 
@@ -197,26 +293,26 @@ def brevo_send_email(to_email: str, subject: str, html: str) -> bool:
         payload["attachment"] = attachments
 
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=12)
+        r = _BREVO_HTTP.post(url, data=orjson.dumps(payload), timeout=12)
         print("[EMAIL] status=", r.status_code)
         print("[EMAIL] response=", r.text)
-        return r.status_code in (200, 201, 202)
+        return r.status_code
     except Exception:
-        return False
+        return None
 
 
 def brevo_send_sms(phone: str, message: str) -> bool:
+    return _brevo_sms_status(phone, message) in BREVO_OK_STATUSES
+
+
+def _brevo_sms_status(phone: str, message: str) -> Optional[int]:
+    """Code HTTP Brevo, BREVO_NOT_CALLED, ou None si la réponse n'est pas arrivée (timeout, réseau)."""
     phone = normalize_phone_fr(phone)
     if not BREVO_API_KEY or not phone:
         print("[SMS] Missing BREVO_API_KEY or phone")
-        return False
+        return BREVO_NOT_CALLED
 
     url = "https://api.brevo.com/v3/transactionalSMS/sms"
-    headers = {
-        "accept": "application/json",
-        "api-key": BREVO_API_KEY,
-        "content-type": "application/json",
-    }
 
     # (souvent requis selon config Brevo) : nom d’expéditeur SMS
     sms_sender = os.environ.get("BREVO_SMS_SENDER", "").strip()
@@ -230,31 +326,376 @@ def brevo_send_sms(phone: str, message: str) -> bool:
         payload["sender"] = sms_sender  # ex: "INTEGRALE"
 
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=12)
+        r = _BREVO_HTTP.post(url, data=orjson.dumps(payload), timeout=12)
 
         # ✅ logs indispensables (status + réponse Brevo)
         print("[SMS] status=", r.status_code)
         print("[SMS] response=", r.text)
 
-        return r.status_code in (200, 201, 202)
+        return r.status_code
     except Exception as e:
         print("[SMS] exception=", repr(e))
+        return None
+
+
+def brevo_send_email_batch(messages: List[Dict[str, str]]) -> Optional[int]:
+    """
+    Un seul appel Brevo pour plusieurs emails (messageVersions).
+    messages : [{"to": ..., "subject": ..., "html": ...}, ...]
+    Retourne le code HTTP de Brevo, BREVO_NOT_CALLED, ou None si la réponse n'est pas arrivée
+    (timeout, réseau) : dans ce cas le lot a PEUT-ÊTRE été accepté.
+    """
+    messages = [m for m in messages if m.get("to")]
+    if not BREVO_API_KEY or not messages:
+        return BREVO_NOT_CALLED
+
+    url = "https://api.brevo.com/v3/smtp/email"
+
+    payload = {
+        "sender": {"name": BREVO_SENDER_NAME, "email": BREVO_SENDER_EMAIL},
+        "subject": messages[0]["subject"],
+        "htmlContent": messages[0]["html"],
+        "messageVersions": [
+            {"to": [{"email": m["to"]}], "subject": m["subject"], "htmlContent": m["html"]}
+            for m in messages
+        ],
+    }
+
+    try:
+        r = _BREVO_HTTP.post(url, data=orjson.dumps(payload), timeout=12)
+        print("[EMAIL BATCH] count=", len(messages), "status=", r.status_code)
+        print("[EMAIL BATCH] response=", r.text)
+        return r.status_code
+    except Exception as e:
+        print("[EMAIL BATCH] exception=", repr(e))
+        return None
+
+
+def _brevo_rejected(status: Optional[int]) -> bool:
+    """Refus explicite du lot (4xx hors limite de débit) : rien n'est parti, on peut envoyer mail par mail."""
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def _brevo_uncertain(status: Optional[int]) -> bool:
+    """Pas de réponse ou erreur serveur : Brevo a PEUT-ÊTRE envoyé, un renvoi automatique ferait un doublon."""
+    return status is None or status >= 500
+
+
+# =========================
+# Files d'envoi email / SMS (lots + limite de débit Brevo)
+# =========================
+
+EMAIL_BATCH_MAX = 100
+EMAIL_BATCH_WINDOW_SECONDS = 0.5
+# ✅ pause entre deux appels Brevo email / SMS (limites de débit du fournisseur)
+EMAIL_BATCH_COOLDOWN_SECONDS = float(os.environ.get("BREVO_EMAIL_COOLDOWN_SECONDS", "1.0"))
+SMS_MIN_INTERVAL_SECONDS = float(os.environ.get("BREVO_SMS_INTERVAL_SECONDS", "0.2"))
+
+# ✅ outbox : chaque envoi en file est aussi écrit sur disque, supprimé après succès
+# (redémarrage / crash : les envois non partis sont rejoués ; refus ou limite de débit : nouvel essai
+# avec délai croissant). Envoi incertain (timeout, 5xx) : JAMAIS renvoyé automatiquement, le job part
+# dans outbox/failed ; pour le renvoyer à la main, remettre le fichier dans outbox/ et redémarrer.
+OUTBOX_DIR = os.path.join(PERSIST_DIR, "outbox")
+OUTBOX_FAILED_DIR = os.path.join(OUTBOX_DIR, "failed")
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE_SECONDS = 30
+
+_EMAIL_QUEUE: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+_SMS_QUEUE: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+_NOTIFY_WORKERS: Dict[str, threading.Thread] = {}
+
+
+def _ensure_notify_worker(name: str, target) -> None:
+    with _LOCK:
+        w = _NOTIFY_WORKERS.get(name)
+        if w is None or not w.is_alive():
+            w = threading.Thread(target=target, name=name, daemon=True)
+            _NOTIFY_WORKERS[name] = w
+            w.start()
+
+
+def _outbox_save(job: Dict[str, Any]) -> None:
+    """Écrit (ou réécrit) le job dans l'outbox ; job["outbox"] = chemin du fichier."""
+    path = job.get("outbox")
+    if not path:
+        os.makedirs(OUTBOX_DIR, exist_ok=True)
+        path = os.path.join(OUTBOX_DIR, f"{time.time_ns()}-{secrets.token_hex(3)}-{job['kind']}.json")
+        job["outbox"] = path
+    try:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps({k: v for k, v in job.items() if k != "outbox"}))
+        os.replace(tmp, path)
+    except OSError as e:
+        print("[OUTBOX] write failed=", repr(e))
+
+
+def _outbox_done(job: Dict[str, Any]) -> None:
+    try:
+        os.remove(job["outbox"])
+    except (KeyError, OSError):
+        pass
+
+
+def _requeue(job: Dict[str, Any]) -> None:
+    if job["kind"] == "sms":
+        _ensure_notify_worker("brevo-sms", _sms_worker_loop)
+        _SMS_QUEUE.put(job)
+    else:
+        # "email" ou "email_batch" (lot déjà tenté, rejoué en entier)
+        _ensure_notify_worker("brevo-email", _email_worker_loop)
+        _EMAIL_QUEUE.put(job)
+
+
+def _outbox_park(job: Dict[str, Any], reason: str) -> None:
+    """Sort le job de la file : outbox/failed, à rejouer à la main."""
+    print("[OUTBOX]", reason, ":", job.get("outbox"))
+    try:
+        os.makedirs(OUTBOX_FAILED_DIR, exist_ok=True)
+        os.replace(job["outbox"], os.path.join(OUTBOX_FAILED_DIR, os.path.basename(job["outbox"])))
+    except (KeyError, OSError):
+        pass
+
+
+def _outbox_failed(job: Dict[str, Any], status: Optional[int]) -> None:
+    if _brevo_uncertain(status):
+        _outbox_park(job, f"envoi incertain (status={status}), pas de renvoi automatique")
+    else:
+        _outbox_retry(job)
+
+
+def _outbox_retry(job: Dict[str, Any]) -> None:
+    """Envoi refusé (rien n'est parti) : nouvel essai après 30 s, 60 s, 120 s... puis abandon dans outbox/failed."""
+    job["attempts"] = int(job.get("attempts") or 0) + 1
+    if job["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+        _outbox_park(job, f"abandon après {job['attempts']} essais")
+        return
+    _outbox_save(job)
+    delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+    timer = threading.Timer(delay, _requeue, args=(job,))
+    timer.daemon = True
+    timer.start()
+
+
+def _send_single_email(m: Dict[str, Any]) -> None:
+    status = _brevo_email_status(m["to"], m["subject"], m["html"])
+    if status in BREVO_OK_STATUSES:
+        _outbox_done(m)
+        return
+    if not m.get("outbox"):
+        # mail issu d'un lot refusé : il devient un envoi à part entière dans l'outbox
+        m = {"kind": "email", "to": m["to"], "subject": m["subject"], "html": m["html"]}
+        _outbox_save(m)
+    _outbox_failed(m, status)
+
+
+def _send_email_batch_job(job: Dict[str, Any]) -> None:
+    """Lot déjà tenté (limite de débit) : rejoué tel quel, jamais éclaté sauf refus explicite."""
+    status = brevo_send_email_batch(job["messages"])
+    if status in BREVO_OK_STATUSES:
+        _outbox_done(job)
+    elif _brevo_rejected(status):
+        _outbox_done(job)
+        for m in job["messages"]:
+            _send_single_email(dict(m))
+    else:
+        _outbox_failed(job, status)
+
+
+def _send_email_batch_or_fallback(batch: List[Dict[str, Any]]) -> None:
+    mails = []
+    for job in batch:
+        if job.get("kind") == "email_batch":
+            _send_email_batch_job(job)
+        else:
+            mails.append(job)
+    if not mails:
+        return
+    if len(mails) == 1:
+        _send_single_email(mails[0])
+        return
+
+    status = brevo_send_email_batch(mails)
+    if status in BREVO_OK_STATUSES:
+        for m in mails:
+            _outbox_done(m)
+    elif _brevo_rejected(status):
+        # ✅ lot refusé par Brevo (rien n'est parti) : envoi unitaire
+        for m in mails:
+            _send_single_email(m)
+    else:
+        # ✅ limite de débit : le lot entier est rejoué plus tard.
+        # Pas de réponse / erreur serveur : Brevo a peut-être envoyé, le lot part dans outbox/failed
+        # (jamais renvoyé automatiquement, ni en lot ni mail par mail : sinon doublons pour tout le monde).
+        job = {"kind": "email_batch", "messages": [
+            {"to": m["to"], "subject": m["subject"], "html": m["html"]} for m in mails
+        ]}
+        _outbox_save(job)
+        for m in mails:
+            _outbox_done(m)
+        _outbox_failed(job, status)
+
+
+def _collect_email_batch(first: Dict[str, Any]) -> List[Dict[str, Any]]:
+    batch = [first]
+    deadline = time.monotonic() + EMAIL_BATCH_WINDOW_SECONDS
+    while len(batch) < EMAIL_BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_EMAIL_QUEUE.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _email_worker_loop() -> None:
+    while True:
+        batch = _collect_email_batch(_EMAIL_QUEUE.get())
+        try:
+            _send_email_batch_or_fallback(batch)
+        except Exception as e:
+            print("[EMAIL QUEUE] exception=", repr(e))
+        time.sleep(EMAIL_BATCH_COOLDOWN_SECONDS)
+
+
+def _apply_sms_stamp(job: Dict[str, Any], ok: bool) -> None:
+    """job["stamp"] = {session_id, trainee_id, field} : résultat de l'envoi noté sur le stagiaire (survit à un redémarrage)."""
+    stamp = job.get("stamp")
+    if not stamp:
+        return
+    with _LOCK:
+        data = load_data()
+        s = find_session(data, stamp.get("session_id") or "")
+        t = find_trainee(s, stamp.get("trainee_id") or "") if s else None
+        if t is not None and stamp.get("field"):
+            t[stamp["field"]] = bool(ok)
+            save_data(data)
+
+
+def _send_queued_sms(job: Dict[str, Any]) -> None:
+    ok = False
+    status: Optional[int] = None
+    try:
+        status = _brevo_sms_status(job["phone"], job["message"])
+        ok = status in BREVO_OK_STATUSES
+    finally:
+        if ok:
+            _outbox_done(job)
+        else:
+            # même règle que les emails : pas de renvoi automatique d'un SMS peut-être parti
+            _outbox_failed(job, status)
+        try:
+            _apply_sms_stamp(job, ok)
+        except Exception as e:
+            print("[SMS] stamp exception=", repr(e))
+
+
+def _sms_worker_loop() -> None:
+    while True:
+        job = _SMS_QUEUE.get()
+        try:
+            _send_queued_sms(job)
+        except Exception as e:
+            print("[SMS QUEUE] exception=", repr(e))
+        time.sleep(SMS_MIN_INTERVAL_SECONDS)
+
+
+def enqueue_brevo_email(to_email: str, subject: str, html: str) -> bool:
+    """Met l'email en file (et dans l'outbox) ; il part dans le prochain lot (<= 500 ms)."""
+    if not BREVO_API_KEY or not to_email:
         return False
+    job = {"kind": "email", "to": to_email, "subject": subject, "html": html}
+    _outbox_save(job)
+    _requeue(job)
+    return True
 
 
-def mail_layout(inner_html: str) -> str:
-    # ✅ logo en URL HTTPS (fiable dans Gmail)
-    logo_src = f"{PUBLIC_BASE_URL.rstrip('/')}/static/logo-integrale.png"
+def brevo_send_sms_async(phone: str, message: str, stamp: Optional[Dict[str, str]] = None) -> bool:
+    """
+    Met le SMS en file (envoi cadencé, outbox). Retourne True s'il a été accepté.
+    stamp = {"session_id", "trainee_id", "field"} : t[field] = résultat, après chaque essai (gardé dans l'outbox).
+    """
+    if not BREVO_API_KEY or not normalize_phone_fr(phone):
+        return False
+    job = {"kind": "sms", "phone": phone, "message": message}
+    if stamp:
+        job["stamp"] = stamp
+    _outbox_save(job)
+    _requeue(job)
+    return True
+
+
+def notify_email_and_sms(to_email: str, subject: str, html: str, phone: str, sms: str) -> Tuple[bool, bool]:
+    """Email + SMS en file : la requête admin répond tout de suite. Retourne (email en file, SMS en file)."""
+    email_ok = enqueue_brevo_email((to_email or "").strip(), subject, html)
+    sms_ok = brevo_send_sms_async(phone or "", sms)
+    return email_ok, sms_ok
+
+
+def replay_outbox() -> int:
+    """
+    Au démarrage du process qui sert les requêtes : remet en file les envois restés dans l'outbox.
+    Appelé par le hook post_worker_init de gunicorn.conf.py, ou par __main__ (serveur de dev).
+    """
+    if not BREVO_API_KEY:
+        return 0
+    try:
+        with os.scandir(OUTBOX_DIR) as it:
+            names = sorted(e.name for e in it if e.is_file() and e.name.endswith(".json"))
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(OUTBOX_DIR, name)
+        try:
+            with open(path, "rb") as f:
+                job = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            continue
+        job["outbox"] = path
+        _requeue(job)
+    if names:
+        print("[OUTBOX] rejoués=", len(names))
+    return len(names)
+
+
+def _drain_email_queue() -> None:
+    batch = []
+    while True:
+        try:
+            batch.append(_EMAIL_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    for i in range(0, len(batch), EMAIL_BATCH_MAX):
+        _send_email_batch_or_fallback(batch[i:i + EMAIL_BATCH_MAX])
+
+
+def _drain_sms_queue() -> None:
+    while True:
+        try:
+            job = _SMS_QUEUE.get_nowait()
+        except queue.Empty:
+            break
+        _send_queued_sms(job)
+
 
-    return f"""
+
+
+# ✅ cadre des emails : parties fixes construites une seule fois (logo en URL HTTPS, fiable dans Gmail)
+_MAIL_LOGO_SRC = f"{PUBLIC_BASE_URL.rstrip('/')}/static/logo-integrale.png"
+
+_MAIL_LAYOUT_HEAD = f"""
     <div style="font-family:Arial,sans-serif;max-width:640px;margin:auto;background:#f7f7f7;padding:18px;border-radius:12px">
       <div style="background:white;padding:18px;border-radius:12px">
         <div style="text-align:center;margin-bottom:18px">
-          <img src="{logo_src}" alt="Intégrale Academy"
+          <img src="{_MAIL_LOGO_SRC}" alt="Intégrale Academy"
                style="height:60px;width:auto;display:block;margin:0 auto;border:0;outline:none;text-decoration:none">
         </div>
 
-        {inner_html}
+        """
+
+_MAIL_LAYOUT_TAIL = """
 
         <p style="margin-top:30px;color:#666;font-size:13px;text-align:center">
           Intégrale Academy
@@ -262,22 +703,71 @@ def mail_layout(inner_html: str) -> str:
       </div>
     </div>
     """
+
+
+def mail_layout(inner_html: str) -> str:
+    return _MAIL_LAYOUT_HEAD + inner_html + _MAIL_LAYOUT_TAIL
+
+
+def _h(value: Any) -> str:
+    """Échappe une valeur saisie (prénom, commentaire...) avant de l'insérer dans un mail HTML."""
+    return str(escape(value))
 # =========================
 # Helpers
 # =========================
 
 def _now_iso() -> str:
-    return datetime.datetime.utcnow().isoformat() + "Z"
+    # ✅ même format que datetime.utcnow().isoformat() + "Z", sans objet datetime
+    # (isoformat() omet la fraction quand les microsecondes valent 0)
+    sec, ns = divmod(time.time_ns(), 1_000_000_000)
+    us = ns // 1000
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec)) + (".%06d" % us if us else "") + "Z"
+
+
+# ✅ Cache mémoire : data.json est lu une seule fois, puis écrit en différé (debounce)
+_DATA: Optional[Dict[str, Any]] = None
+_DIRTY = False
+_LOCK = threading.RLock()
+_DIRTY_EVENT = threading.Event()
+_WRITER: Optional[threading.Thread] = None
+FLUSH_DELAY_SECONDS = 1.5
+FLUSH_MAX_PENDING = 100
+FLUSH_POLL_SECONDS = 0.25
+_PENDING_WRITES = 0
+_LAST_SAVE_TS = 0.0
+# ✅ incrémenté à chaque save_data : sert à invalider les caches dérivés (stats…)
+_DATA_VERSION = 0
+
+
+_LAST_WRITTEN_DIGEST = b""
+
+
+def _write_disk(data: Dict[str, Any]) -> None:
+    global _LAST_WRITTEN_DIGEST
+    # ✅ JSON compact (lu par l'app, pas par un humain) : lisible via /admin/debug/dump
+    raw = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    # ✅ contenu identique au dernier fichier écrit : pas de réécriture
+    # (optimisation du stockage JSON actuel ; le passage à SQLite n'a pas été fait, cf. historique chunk1-8)
+    digest = hashlib.blake2b(raw, digest_size=16).digest()
+    if digest == _LAST_WRITTEN_DIGEST and os.path.exists(DATA_FILE):
+        return
 
+    tmp = DATA_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+    os.replace(tmp, DATA_FILE)
+    _LAST_WRITTEN_DIGEST = digest
 
-def load_data() -> Dict[str, Any]:
+
+def _read_disk() -> Dict[str, Any]:
     if not os.path.exists(DATA_FILE):
         base = {"sessions": []}
-        save_data(base)
+        _write_disk(base)
         return base
     try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        with open(DATA_FILE, "rb") as f:
+            data = orjson.loads(f.read())
 
         # ✅ Assure que tous les stagiaires ont un public_token
         changed = False
@@ -289,8 +779,12 @@ def load_data() -> Dict[str, Any]:
         if normalize_sessions_schema(data):
             changed = True
 
+        # ✅ documents requis + statuts canoniques : fait ici une fois, les pages GET n'ont plus rien à réécrire
+        if normalize_trainees_documents(data):
+            changed = True
+
         if changed:
-            save_data(data)
+            _write_disk(data)
 
         return data
 
@@ -302,24 +796,157 @@ def load_data() -> Dict[str, Any]:
         except Exception:
             pass
         base = {"sessions": []}
-        save_data(base)
+        _write_disk(base)
         return base
 
 
+def load_data() -> Dict[str, Any]:
+    global _DATA
+    with _LOCK:
+        if _DATA is None:
+            _DATA = _read_disk()
+        return _DATA
+
+
+def _flush_to_disk() -> None:
+    global _DIRTY, _PENDING_WRITES
+    with _LOCK:
+        _DIRTY_EVENT.clear()
+        if not _DIRTY or _DATA is None:
+            return
+        _write_disk(_DATA)
+        _DIRTY = False
+        _PENDING_WRITES = 0
+
+
+def _writer_loop() -> None:
+    """
+    Thread d'écriture : regroupe les modifications et écrit data.json
+    après FLUSH_DELAY_SECONDS sans nouvelle modification, ou dès FLUSH_MAX_PENDING en attente.
+    """
+    while True:
+        _DIRTY_EVENT.wait()
+        while True:
+            with _LOCK:
+                idle = time.monotonic() - _LAST_SAVE_TS
+                if _PENDING_WRITES >= FLUSH_MAX_PENDING or idle >= FLUSH_DELAY_SECONDS:
+                    break
+            time.sleep(min(FLUSH_DELAY_SECONDS - idle, FLUSH_POLL_SECONDS))
+        try:
+            _flush_to_disk()
+        except Exception as e:
+            print("[DATA] flush exception=", repr(e))
+
+
+def mark_dirty() -> None:
+    """Signale une modification du cache mémoire : l'écriture disque se fait en arrière-plan."""
+    global _DIRTY, _DATA_VERSION, _PENDING_WRITES, _LAST_SAVE_TS, _WRITER
+    with _LOCK:
+        _DIRTY = True
+        _DATA_VERSION += 1
+        _PENDING_WRITES += 1
+        _LAST_SAVE_TS = time.monotonic()
+        if _WRITER is None or not _WRITER.is_alive():
+            _WRITER = threading.Thread(target=_writer_loop, daemon=True)
+            _WRITER.start()
+        _DIRTY_EVENT.set()
 
 
 def save_data(data: Dict[str, Any]) -> None:
-    tmp = DATA_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, DATA_FILE)
+    global _DATA
+    with _LOCK:
+        _DATA = data
+        mark_dirty()
+
+
+def flush_pending_work() -> None:
+    """
+    Arrêt du process : vide les files SMS / email puis écrit data.json
+    (les callbacks SMS peuvent encore modifier les données, donc l'écriture passe en dernier).
+    """
+    for step in (_drain_sms_queue, _drain_email_queue, _flush_to_disk):
+        try:
+            step()
+        except Exception as e:
+            print("[SHUTDOWN] exception=", step.__name__, repr(e))
+
+
+atexit.register(flush_pending_work)
+
+
+# ✅ ETag des pages admin : change à chaque modification des données (et à chaque redémarrage)
+_BOOT_ID = secrets.token_hex(4)
+
+
+def data_etag() -> str:
+    return f"{_BOOT_ID}-{_DATA_VERSION}"
+
+
+def not_modified(etag: str) -> bool:
+    return request.if_none_match.contains(etag)
+
+
+def with_etag(rv, etag: str):
+    """Réponse revalidée à chaque navigation (no-cache) : le navigateur renvoie If-None-Match."""
+    resp = app.make_response(rv)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def etag_by_data_version(view):
+    """Page de lecture : 304 tant que les données n'ont pas changé (pas de rendu)."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        etag = data_etag()
+        if not_modified(etag):
+            return with_etag(("", 304), etag)
+        return with_etag(view(*args, **kwargs), etag)
+    return wrapped
+
+
+def trainee_action_done(session_id: str, trainee_id: str, error: str = "", **stamps: Any):
+    """
+    Fin d'une action POST sur la fiche stagiaire.
+    Envoyée en fetch (X-Requested-With) : JSON des champs modifiés, la page se met à jour sans re-rendu complet.
+    Sinon : 303 vers la fiche (Post/Redirect/Get).
+    """
+    if request.headers.get("X-Requested-With") == "fetch":
+        if error:
+            return jsonify({"ok": False, "error": error}), 400
+        return jsonify({"ok": True, **stamps})
+    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id), code=303)
+
+
+# ✅ Index {id: objet} : reconstruits après chaque modification enregistrée (_DATA_VERSION),
+# ou si la liste a été remplacée / a changé de taille avant le save_data
+def _new_index() -> Dict[str, Any]:
+    return {"list": None, "size": -1, "version": -1, "by_id": {}}
+
+
+_SESSION_IDX: Dict[str, Any] = _new_index()
+# ✅ un index par session, tous vidés au changement de _DATA_VERSION (sessions supprimées : aucune référence gardée)
+_TRAINEE_IDX: Dict[str, Any] = {"version": -1, "by_session": {}}
+
+
+def _indexed_lookup(idx: Dict[str, Any], items: List[Dict[str, Any]], item_id: str) -> Optional[Dict[str, Any]]:
+    if idx["list"] is not items or idx["size"] != len(items) or idx["version"] != _DATA_VERSION:
+        idx["list"] = items
+        idx["size"] = len(items)
+        idx["version"] = _DATA_VERSION
+        idx["by_id"] = {x.get("id"): x for x in items}
+    hit = idx["by_id"].get(item_id)
+    if hit is not None and hit.get("id") != item_id:
+        # id modifié sur place, pas encore enregistré : index périmé
+        idx["by_id"] = {x.get("id"): x for x in items}
+        hit = idx["by_id"].get(item_id)
+    return hit
 
 
 def find_session(data: Dict[str, Any], session_id: str) -> Optional[Dict[str, Any]]:
-    for s in data.get("sessions", []):
-        if s.get("id") == session_id:
-            return s
-    return None
+    sessions = data.get("sessions", [])
+    with _LOCK:
+        return _indexed_lookup(_SESSION_IDX, sessions, session_id)
 
 
 def ensure_public_tokens(data):
@@ -330,39 +957,63 @@ def ensure_public_tokens(data):
 
         for trainee in trainees:
             if "public_token" not in trainee or not trainee["public_token"]:
-                trainee["public_token"] = uuid.uuid4().hex
+                trainee["public_token"] = secrets.token_hex(16)
                 changed = True
 
     return changed
 
 
 
-def find_trainee(session: Dict[str, Any], trainee_id: str) -> Optional[Dict[str, Any]]:
-    for t in session.get("trainees", []):
-        if t.get("id") == trainee_id:
-            return t
-    return None
+def find_trainee(session: Dict[str, Any], trainee_id: str,
+                 trainees: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    trainees : liste déjà obtenue via _session_trainees_list(session).
+    Copie convertie d'une ancienne session (« stagiaires ») : pas d'index, simple parcours.
+    """
+    if trainees is None:
+        trainees = session.get("trainees", [])
+    elif trainees is not session.get("trainees"):
+        return next((x for x in trainees if x.get("id") == trainee_id), None)
+    with _LOCK:
+        if _TRAINEE_IDX["version"] != _DATA_VERSION:
+            _TRAINEE_IDX["version"] = _DATA_VERSION
+            _TRAINEE_IDX["by_session"] = {}
+        by_session = _TRAINEE_IDX["by_session"]
+        idx = by_session.get(session.get("id") or "")
+        if idx is None:
+            idx = by_session[session.get("id") or ""] = _new_index()
+        return _indexed_lookup(idx, trainees, trainee_id)
+
+
+def docs_by_key(t: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Documents du stagiaire indexés par clé (une seule passe au lieu d'un parcours par recherche)."""
+    return {d.get("key"): d for d in (t.get("documents") or []) if isinstance(d, dict)}
+
+
+# old keys from previous versions
+_SESSION_FR_KEYS = {
+    "name": "nom",
+    "date_start": "date_debut",
+    "date_end": "date_fin",
+    "exam_date": "date_examen",
+    "training_type": "type_formation",
+    "trainees": "stagiaires",
+}
 
 
 def _session_get(s: Dict[str, Any], key: str, fallback: str = "") -> str:
     """
     Backward compatible getter: support old FR keys if needed.
     """
-    if key in s and s.get(key) not in (None, ""):
-        return s.get(key)
-
-    # old keys from previous versions
-    fr_map = {
-        "name": "nom",
-        "date_start": "date_debut",
-        "date_end": "date_fin",
-        "exam_date": "date_examen",
-        "training_type": "type_formation",
-        "trainees": "stagiaires",
-    }
-    fr_key = fr_map.get(key)
-    if fr_key and fr_key in s and s.get(fr_key) not in (None, ""):
-        return s.get(fr_key)
+    v = s.get(key)
+    if v is not None and v != "":
+        return v
+
+    fr_key = _SESSION_FR_KEYS.get(key)
+    if fr_key:
+        v = s.get(fr_key)
+        if v is not None and v != "":
+            return v
 
     return fallback
 
@@ -371,18 +1022,19 @@ def _session_trainees_list(s: Dict[str, Any]) -> List[Dict[str, Any]]:
     if "trainees" in s and isinstance(s.get("trainees"), list):
         return s.get("trainees", [])
     if "stagiaires" in s and isinstance(s.get("stagiaires"), list):
-        # convert on the fly (non destructif)
-        out = []
-        for st in s.get("stagiaires", []):
-            out.append(_convert_old_stagiaire_to_trainee(st))
-        return out
+        # ✅ conversion faite une seule fois : la liste convertie est gardée sur la session
+        # (ids générés stables d'un appel à l'autre ; « stagiaires » est retiré à la prochaine sauvegarde)
+        with _LOCK:
+            if not isinstance(s.get("trainees"), list):
+                s["trainees"] = [_convert_old_stagiaire_to_trainee(st) for st in s.get("stagiaires", [])]
+            return s["trainees"]
     return []
 
 
 def _convert_old_stagiaire_to_trainee(st: Dict[str, Any]) -> Dict[str, Any]:
     # best-effort mapping
     return {
-        "id": st.get("id") or ("TRN-" + uuid.uuid4().hex[:8].upper()),
+        "id": st.get("id") or ("TRN-" + secrets.token_hex(4).upper()),
         "personal_id": st.get("id") or "",
         "last_name": st.get("nom") or "",
         "first_name": st.get("prenom") or "",
@@ -404,49 +1056,55 @@ def _convert_old_stagiaire_to_trainee(st: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+# ✅ anciennes valeurs FR -> enums : une recherche dans un dict (les sous-chaînes ne servent qu'en repli)
+_CONVENTION_ENUM = {
+    "signée": "signed", "signee": "signed", "signed": "signed",
+    "en cours de signature": "signing", "signing": "signing",
+}
+_TESTFR_ENUM = {
+    "validé": "validated", "valide": "validated", "validated": "validated",
+    "relancé": "relance", "relance": "relance", "relancé(e)": "relance", "relancee": "relance",
+    "en cours": "in_progress", "in progress": "in_progress", "in_progress": "in_progress", "en_cours": "in_progress",
+}
+_FINANCEMENT_ENUM = {
+    "validé": "validated", "valide": "validated", "validated": "validated",
+    "en cours de validation": "in_review", "in_review": "in_review",
+}
+_VAE_ENUM = {
+    "validé": "validated", "valide": "validated", "validated": "validated",
+    "en cours": "in_progress", "in_progress": "in_progress", "in progress": "in_progress",
+}
+_HOSTING_ENUM = {
+    "réservé": "reserved", "reserve": "reserved", "reserved": "reserved",
+}
+
+
 def _map_convention_to_enum(v: Optional[str]) -> str:
     v = (v or "").strip().lower()
-    if v in ("signée", "signee", "signed"):
-        return "signed"
-    if "signature" in v or v in ("en cours de signature", "signing"):
-        return "signing"
-    return "soon"
+    hit = _CONVENTION_ENUM.get(v)
+    if hit:
+        return hit
+    return "signing" if "signature" in v else "soon"
 
 
 def _map_testfr_to_enum(v: Optional[str]) -> str:
-    v = (v or "").strip().lower()
-    if v in ("validé", "valide", "validated"):
-        return "validated"
-    if v in ("relancé", "relance", "relancé(e)", "relancee"):
-        return "relance"
-    if v in ("en cours", "in progress", "in_progress", "en_cours"):
-        return "in_progress"
-    return "soon"
+    return _TESTFR_ENUM.get((v or "").strip().lower(), "soon")
 
 
 def _map_financement_to_enum(v: Optional[str]) -> str:
     v = (v or "").strip().lower()
-    if v in ("validé", "valide", "validated"):
-        return "validated"
-    if "validation" in v or v in ("en cours de validation", "in_review"):
-        return "in_review"
-    return "soon"
+    hit = _FINANCEMENT_ENUM.get(v)
+    if hit:
+        return hit
+    return "in_review" if "validation" in v else "soon"
 
 
 def _map_vae_to_enum(v: Optional[str]) -> str:
-    v = (v or "").strip().lower()
-    if v in ("validé", "valide", "validated"):
-        return "validated"
-    if v in ("en cours", "in_progress", "in progress"):
-        return "in_progress"
-    return "soon"
+    return _VAE_ENUM.get((v or "").strip().lower(), "soon")
 
 
 def _map_hosting_to_enum(v: Optional[str]) -> str:
-    v = (v or "").strip().lower()
-    if v in ("réservé", "reserve", "reserved"):
-        return "reserved"
-    return "unknown"
+    return _HOSTING_ENUM.get((v or "").strip().lower(), "unknown")
 
 
 
@@ -456,26 +1114,19 @@ def _map_hosting_to_enum(v: Optional[str]) -> str:
 # =========================
 
 def trainee_is_conform(t: Dict[str, Any], training_type: str) -> bool:
-    if t.get("convention_status") != "signed":
-        return False
-    if t.get("test_fr_status") != "validated":
-        return False
-    if t.get("dossier_status") != "complete":
-        return False
-    if t.get("financement_status") != "validated":
-        return False
-    if training_type == "DIRIGEANT VAE":
-        if t.get("vae_status") != "validated":
-            return False
-    return True
+    # ✅ ordre : dossier + financement d'abord (les plus souvent non conformes) -> sortie rapide
+    g = t.get
+    return (
+        g("dossier_status") == "complete"
+        and g("financement_status") == "validated"
+        and g("convention_status") == "signed"
+        and g("test_fr_status") == "validated"
+        and (training_type != "DIRIGEANT VAE" or g("vae_status") == "validated")
+    )
 
 
 def session_is_conform(session: Dict[str, Any]) -> bool:
-    training_type = _session_get(session, "training_type", "")
-    trainees = _session_trainees_list(session)
-    if not trainees:
-        return False
-    return all(trainee_is_conform(t, training_type) for t in trainees)
+    return session_summary(session)["session_is_conform"]
 
 def normalize_sessions_schema(data: Dict[str, Any]) -> bool:
     changed = False
@@ -493,41 +1144,162 @@ def normalize_sessions_schema(data: Dict[str, Any]) -> bool:
     return changed
 
 
-def compute_stats(session: Dict[str, Any]) -> Dict[str, Any]:
-    training_type = _session_get(session, "training_type", "")
+def normalize_trainees_documents(data: Dict[str, Any]) -> bool:
+    changed = False
+    for s in data.get("sessions", []):
+        training_type = _session_get(s, "training_type", "")
+        for t in s.get("trainees") or []:
+            if isinstance(t, dict) and ensure_documents_schema_for_trainee(t, training_type):
+                changed = True
+    return changed
+
+
+# ✅ stats par session recalculées seulement après une modification (save_data)
+_SESSION_SUMMARY_CACHE: Dict[str, Any] = {}
+
+
+def session_summary(session: Dict[str, Any]) -> Dict[str, Any]:
+    sid = session.get("id") or ""
+    with _LOCK:
+        hit = _SESSION_SUMMARY_CACHE.get(sid)
+        if hit and hit[0] == _DATA_VERSION:
+            return hit[1]
+        version = _DATA_VERSION
+
+    # ✅ un seul passage sur les stagiaires : conformité + docs fin de formation (COMPLETS / total)
     trainees = _session_trainees_list(session)
-    conform_count = sum(1 for t in trainees if trainee_is_conform(t, training_type))
+    training_type = _session_get(session, "training_type", "")
+    conform_count = 0
+    done_total = 0
+    for t in trainees:
+        if trainee_is_conform(t, training_type):
+            conform_count += 1
+        if deliverables_progress(t)[2]:
+            done_total += 1
+
     total = len(trainees)
-    return {
+    summary = {
         "total": total,
         "conform_count": conform_count,
         "non_conform_count": total - conform_count,
         "session_is_conform": (total > 0 and conform_count == total),
+        "deliverables_done": done_total,
+        "deliverables_total": total,
     }
+    with _LOCK:
+        _SESSION_SUMMARY_CACHE[sid] = (version, summary)
+    return summary
+
+
+def session_summary_stats(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Stats de conformité seules (total, conform_count, non_conform_count, session_is_conform), depuis le cache."""
+    summary = session_summary(session)
+    return {k: summary[k] for k in ("total", "conform_count", "non_conform_count", "session_is_conform")}
 
 
 # =========================
 # CNAPS / Hosting fetchers
 # =========================
 
+def _normalize_cnaps(value: Any) -> str:
+    """Forme canonique d'un statut CNAPS (majuscules, espaces simples) : calculée à l'écriture."""
+    return " ".join(str(value or "").upper().split())
+
+
+EXTERNAL_FETCH_WORKERS = int(os.environ.get("EXTERNAL_FETCH_WORKERS", "16"))
+EXTERNAL_CACHE_TTL_SECONDS = int(os.environ.get("EXTERNAL_CACHE_TTL_SECONDS", "900"))
+EXTERNAL_CACHE_MAXSIZE = 4096
+
+
+def _ttl_cache(ttl: int, maxsize: int):
+    """
+    Mémorise les résultats non vides pendant `ttl` secondes.
+    refresh=True force l'appel réseau (et remet le cache à jour).
+    Appels simultanés avec les mêmes arguments : un seul appel réseau, les autres attendent son résultat.
+    """
+    def deco(fn):
+        cache: Dict[Any, Any] = {}
+        inflight: Dict[Any, Future] = {}
+        lock = threading.Lock()
+
+        @wraps(fn)
+        def wrapper(*args, refresh: bool = False):
+            now = time.monotonic()
+            with lock:
+                hit = None if refresh else cache.get(args)
+                if hit and hit[0] > now:
+                    return hit[1]
+                fut = inflight.get(args)
+                owner = fut is None
+                if owner:
+                    fut = inflight[args] = Future()
+
+            if not owner:
+                return fut.result()
+
+            try:
+                value = fn(*args)
+            except BaseException as e:
+                fut.set_exception(e)
+                raise
+            finally:
+                with lock:
+                    inflight.pop(args, None)
+
+            if value is not None:
+                with lock:
+                    if len(cache) >= maxsize:
+                        cache.clear()
+                    cache[args] = (now + ttl, value)
+            fut.set_result(value)
+            return value
+
+        def cache_get(*args):
+            """Valeur encore valide pour ces arguments, sans appel réseau (None sinon)."""
+            with lock:
+                hit = cache.get(args)
+            return hit[1] if hit and hit[0] > time.monotonic() else None
+
+        def cache_put(*args, value):
+            """Résultat obtenu ailleurs (lookup groupé) : rangé sous la même clé qu'un appel unitaire."""
+            if value is None:
+                return
+            with lock:
+                if len(cache) >= maxsize:
+                    cache.clear()
+                cache[args] = (time.monotonic() + ttl, value)
+
+        wrapper.cache_clear = cache.clear
+        wrapper.cache_get = cache_get
+        wrapper.cache_put = cache_put
+        return wrapper
+    return deco
+
+
+# ✅ pool partagé pour les lookups CNAPS / hébergement (pas de création de threads à chaque page)
+_EXTERNAL_POOL = ThreadPoolExecutor(max_workers=EXTERNAL_FETCH_WORKERS, thread_name_prefix="external")
+
+
+@_ttl_cache(EXTERNAL_CACHE_TTL_SECONDS, EXTERNAL_CACHE_MAXSIZE)
 def fetch_cnaps_status_by_name(nom: str, prenom: str) -> Optional[str]:
     if not CNAPS_LOOKUP_ENDPOINT:
         return None
     try:
-        r = requests.get(CNAPS_LOOKUP_ENDPOINT, params={"nom": nom, "prenom": prenom}, timeout=10)
+        r = _HTTP.get(CNAPS_LOOKUP_ENDPOINT, params={"nom": nom, "prenom": prenom}, timeout=10)
         if r.status_code != 200:
             return None
         data = r.json()
-        return data.get("statut_cnaps") or data.get("status")
+        return _normalize_cnaps(data.get("statut_cnaps") or data.get("status")) or None
     except Exception:
         return None
 
 
+@_ttl_cache(EXTERNAL_CACHE_TTL_SECONDS, EXTERNAL_CACHE_MAXSIZE)
 def fetch_hebergement_status(email: str) -> Optional[str]:
     if not HEBERGEMENT_STATUS_ENDPOINT:
         return None
     try:
-        r = requests.get(HEBERGEMENT_STATUS_ENDPOINT, params={"email": email}, timeout=10)
+        r = _HTTP.get(HEBERGEMENT_STATUS_ENDPOINT, params={"email": email}, timeout=10)
         if r.status_code != 200:
             return None
         data = r.json()
@@ -540,20 +1312,200 @@ def fetch_hebergement_status(email: str) -> Optional[str]:
         return None
 
 
-# =========================
-# UI enums (for template)
-# =========================
+def fetch_cnaps_status_bulk(names: List[Tuple[str, str]], refresh: bool = False) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Statuts CNAPS pour plusieurs (nom, prénom), partageant le cache TTL de fetch_cnaps_status_by_name.
+    - noms déjà en cache (sauf refresh=True) : pas d'appel
+    - CNAPS_BULK_LOOKUP_ENDPOINT configuré : un seul POST pour le reste, réponse [{"nom","prenom","statut_cnaps"}],
+      chaque résultat est rangé dans le cache unitaire
+    - noms absents de la réponse groupée (ou pas d'endpoint groupé / échec) : lookups unitaires en parallèle
+    """
+    names = list(dict.fromkeys(names))
+    out: Dict[Tuple[str, str], Optional[str]] = {}
+
+    pending = []
+    for np in names:
+        hit = None if refresh else fetch_cnaps_status_by_name.cache_get(*np)
+        if hit is not None:
+            out[np] = hit
+        else:
+            pending.append(np)
+    if not pending:
+        return out
 
-FORMATION_TYPES = ["APS", "A3P", "DIRIGEANT initial", "DIRIGEANT VAE", "SSIAP 1", "CHEF DE POSTE"]
+    if CNAPS_BULK_LOOKUP_ENDPOINT:
+        try:
+            r = _HTTP.post(
+                CNAPS_BULK_LOOKUP_ENDPOINT,
+                json=[{"nom": n, "prenom": p} for n, p in pending],
+                timeout=20,
+            )
+            if r.status_code == 200:
+                wanted = set(pending)
+                for row in r.json() or []:
+                    key = ((row.get("nom") or "").strip(), (row.get("prenom") or "").strip())
+                    if key not in wanted:
+                        continue
+                    value = _normalize_cnaps(row.get("statut_cnaps") or row.get("status")) or None
+                    out[key] = value
+                    fetch_cnaps_status_by_name.cache_put(*key, value=value)
+                pending = [np for np in pending if np not in out]
+        except Exception as e:
+            print("[CNAPS BULK] exception=", repr(e))
 
-ENUMS = {
-    "convention": ["soon", "signing", "signed"],
+    if pending:
+        results = _EXTERNAL_POOL.map(lambda np: fetch_cnaps_status_by_name(np[0], np[1], refresh=refresh), pending)
+        out.update(zip(pending, results))
+    return out
+
+
+def refresh_trainees_external_status(trainees: List[Dict[str, Any]], training_type: str, refresh: bool = False) -> bool:
+    """
+    Met à jour t["cnaps"] / t["hosting_status"] pour chaque stagiaire.
+    CNAPS : un lookup groupé pour toute la session ; hébergement : appels en parallèle.
+    L'écriture dans les dicts se fait ensuite. refresh=True ignore le cache TTL des lookups.
+    Retourne True si au moins une valeur stockée a changé.
+    """
+    names: Dict[int, Tuple[str, str]] = {}
+    hosting_jobs = {}
+
+    for t in trainees:
+        ln = (t.get("last_name") or "").strip()
+        fn = (t.get("first_name") or "").strip()
+
+        # ✅ si déjà validé manuellement, on ne touche pas
+        if (t.get("cnaps") or "").strip().upper() != "CARTE PROFESSIONNELLE OK" and ln and fn:
+            names[id(t)] = (ln, fn)
+
+        # hosting only for A3P
+        if training_type == "A3P":
+            email = t.get("email") or ""
+            if email:
+                hosting_jobs[id(t)] = _EXTERNAL_POOL.submit(fetch_hebergement_status, email, refresh=refresh)
+
+    cnaps_by_name = fetch_cnaps_status_bulk(list(names.values()), refresh=refresh)
+
+    cnaps_results = {tid: cnaps_by_name.get(np) for tid, np in names.items()}
+    hosting_results = {tid: fut.result() for tid, fut in hosting_jobs.items()}
+
+    with _LOCK:
+        return _apply_external_status(trainees, training_type, cnaps_results, hosting_results)
+
+
+def _apply_external_status(trainees, training_type, cnaps_results, hosting_results) -> bool:
+    dirty = False
+    for t in trainees:
+        before = (t.get("cnaps"), t.get("hosting_status"), "hosting_status" in t)
+
+        cn = cnaps_results.get(id(t))
+
+        # ✅ n'écrase jamais avec INCONNU
+        if cn:
+            cn_u = _normalize_cnaps(cn)
+            if cn_u not in ("INCONNU", "UNKNOWN", ""):
+                t["cnaps"] = cn_u
+
+        # valeur par défaut si vide
+        if not (t.get("cnaps") or "").strip():
+            t["cnaps"] = "INCONNU"
+
+        if training_type == "A3P":
+            hb = hosting_results.get(id(t))
+            t["hosting_status"] = hb if hb else (t.get("hosting_status") or "unknown")
+        else:
+            t.pop("hosting_status", None)
+
+        if (t.get("cnaps"), t.get("hosting_status"), "hosting_status" in t) != before:
+            dirty = True
+
+    return dirty
+
+
+_REFRESH_RUNNING: set = set()
+
+
+def _refresh_session_job(session_id: str) -> None:
+    try:
+        data = load_data()
+        s = find_session(data, session_id)
+        if not s:
+            return
+        with _LOCK:
+            dirty = "stagiaires" in s or not isinstance(s.get("trainees"), list)
+            trainees = _session_trainees_list(s)
+            s["trainees"] = trainees
+            s.pop("stagiaires", None)
+        if refresh_trainees_external_status(trainees, _session_get(s, "training_type", "")):
+            dirty = True
+        # ✅ pas de réécriture de data.json si rien n'a changé
+        if dirty:
+            save_data(data)
+    except Exception as e:
+        print("[REFRESH] exception=", repr(e))
+    finally:
+        with _LOCK:
+            _REFRESH_RUNNING.discard(session_id)
+
+
+def start_background_session_refresh(session_id: str) -> bool:
+    """Lance le refresh CNAPS/hébergement d'une session dans un thread (un seul à la fois par session)."""
+    with _LOCK:
+        if session_id in _REFRESH_RUNNING:
+            return False
+        _REFRESH_RUNNING.add(session_id)
+    threading.Thread(target=_refresh_session_job, args=(session_id,), daemon=True).start()
+    return True
+
+
+# =========================
+# UI enums (for template)
+# =========================
+
+FORMATION_TYPES = ["APS", "A3P", "DIRIGEANT initial", "DIRIGEANT VAE", "SSIAP 1", "CHEF DE POSTE"]
+
+ENUMS = {
+    "convention": ["soon", "signing", "signed"],
     "test_fr": ["soon", "in_progress", "validated", "relance"],
     "dossier": ["complete", "incomplete"],
     "financement": ["soon", "in_review", "validated"],
     "vae": ["soon", "in_progress", "validated"],
 }
 
+# ✅ couleur des pastilles de statut (espace stagiaire) : une seule lookup par cellule
+_BADGE_MAP: Dict[str, Dict[str, str]] = {
+    "convention": {"signed": "green", "signing": "yellow"},
+    "dossier": {"complete": "green"},
+    "test_fr": {"validated": "green", "relance": "orange", "in_progress": "yellow"},
+    "financement": {"validated": "green", "in_review": "yellow"},
+    "hosting": {"reserved": "green"},
+    "cnaps": {
+        "DELIVREE": "green", "DÉLIVRÉE": "green", "VALIDE": "green", "VALIDEE": "green", "VALIDÉE": "green",
+        "INSTRUCTION": "yellow", "EN INSTRUCTION": "yellow", "EN_INSTRUCTION": "yellow",
+        "REFUSEE": "red", "REFUSÉE": "red", "EXPIREE": "red", "EXPIRÉE": "red",
+        "INCONNU": "red", "UNKNOWN": "red", "": "red",
+    },
+}
+_BADGE_DEFAULT = {"cnaps": "gray"}
+
+
+@lru_cache(maxsize=512)
+def _badge_class_cached(kind: str, v: str) -> str:
+    if kind == "cnaps":
+        v = _normalize_cnaps(v)
+    return _BADGE_MAP.get(kind, {}).get(v, _BADGE_DEFAULT.get(kind, "red" if kind in _BADGE_MAP else "gray"))
+
+
+def badge_class(kind: str, value: Any) -> str:
+    return _badge_class_cached(kind, str(value or ""))
+
+
+# ✅ constantes disponibles dans tous les templates (plus besoin de les passer à chaque rendu)
+app.jinja_env.globals.update(
+    badge_class=badge_class,
+    enums=ENUMS,
+    formation_types=FORMATION_TYPES,
+)
+
 # =========================
 # Libellés longs (pour mails/SMS)
 # =========================
@@ -602,6 +1554,32 @@ def required_docs_for_training(training_type: str) -> List[Dict[str, Any]]:
         docs += list(REQUIRED_DOCS["A3P_ONLY"])
     return docs
 
+# ✅ statuts de documents : stockés sous forme canonique (les lectures comparent sans .strip()/.upper())
+DOC_STATUS_CONFORME = "CONFORME"
+DOC_STATUS_NON_CONFORME = "NON CONFORME"
+DOC_STATUS_A_CONTROLER = "A CONTRÔLER"
+DOC_STATUS_NON_DEPOSE = "NON DÉPOSÉ"
+
+_DOC_STATUS_CANON = {
+    "CONFORME": DOC_STATUS_CONFORME,
+    "NON CONFORME": DOC_STATUS_NON_CONFORME,
+    "NON_CONFORME": DOC_STATUS_NON_CONFORME,
+    "A CONTRÔLER": DOC_STATUS_A_CONTROLER,
+    "A CONTROLER": DOC_STATUS_A_CONTROLER,
+    "À CONTRÔLER": DOC_STATUS_A_CONTROLER,
+    "NON DÉPOSÉ": DOC_STATUS_NON_DEPOSE,
+    "NON DEPOSE": DOC_STATUS_NON_DEPOSE,
+    "NON_DEPOSE": DOC_STATUS_NON_DEPOSE,
+    "": DOC_STATUS_NON_DEPOSE,
+}
+
+
+def canonical_doc_status(value: Any) -> str:
+    """Normalise un statut saisi / ancien (casse, accents, underscore) vers sa valeur canonique."""
+    st = str(value or "").strip().upper()
+    return _DOC_STATUS_CANON.get(st, st)
+
+
 def ensure_documents_schema_for_trainee(t: Dict[str, Any], training_type: str) -> bool:
     """
     S'assure que t["documents"] contient tous les docs requis pour la formation,
@@ -623,8 +1601,9 @@ def ensure_documents_schema_for_trainee(t: Dict[str, Any], training_type: str) -
                 d["label"] = rd["label"]; changed = True
             if "accept" not in d:
                 d["accept"] = rd.get("accept", ""); changed = True
-            if "status" not in d:
-                d["status"] = "NON DÉPOSÉ"; changed = True
+            st = canonical_doc_status(d.get("status"))
+            if d.get("status") != st:
+                d["status"] = st; changed = True
             if "comment" not in d:
                 d["comment"] = ""; changed = True
             if "file" not in d:
@@ -638,7 +1617,7 @@ def ensure_documents_schema_for_trainee(t: Dict[str, Any], training_type: str) -
                 "key": k,
                 "label": rd["label"],
                 "accept": rd.get("accept", ""),
-                "status": "NON DÉPOSÉ",
+                "status": DOC_STATUS_NON_DEPOSE,
                 "comment": "",
                 "file": "",
                 "files": [],
@@ -655,6 +1634,16 @@ def ensure_documents_schema_for_trainee(t: Dict[str, Any], training_type: str) -
 def allowed_doc_keys_for_training(training_type: str) -> set:
     return {d["key"] for d in required_docs_for_training(training_type)}
 
+@lru_cache(maxsize=64)
+def _required_doc_keys(training_type: str, no_permis: bool) -> tuple:
+    tt = (training_type or "").strip().upper()
+    return tuple(
+        rd["key"] for rd in required_docs_for_training(training_type)
+        # permis optionnel si no_permis
+        if not (tt == "A3P" and rd["key"] == "permis" and no_permis)
+    )
+
+
 def dossier_is_complete(trainee: Dict[str, Any], training_type: str) -> bool:
     """
     Complet si TOUS les docs requis sont CONFORME,
@@ -664,24 +1653,13 @@ def dossier_is_complete(trainee: Dict[str, Any], training_type: str) -> bool:
     if not docs:
         return False
 
-    by_key = {d.get("key"): d for d in docs if isinstance(d, dict)}
-
-    tt = (training_type or "").strip().upper()
+    status_by_key = {d.get("key"): d.get("status") for d in docs if isinstance(d, dict)}
     no_permis = bool(trainee.get("no_permis"))  # checkbox "je n'ai pas le permis"
 
-    for rd in required_docs_for_training(training_type):
-        k = rd["key"]
-
-        # permis optionnel si no_permis
-        if tt == "A3P" and k == "permis" and no_permis:
-            continue
-
-        d = by_key.get(k)
-        if not d:
+    for k in _required_doc_keys(training_type, no_permis):
+        if k not in status_by_key:
             return False
-
-        st = (d.get("status") or "").strip().upper()
-        if st != "CONFORME":
+        if status_by_key[k] != DOC_STATUS_CONFORME:
             return False
 
     return True
@@ -689,33 +1667,38 @@ def dossier_is_complete(trainee: Dict[str, Any], training_type: str) -> bool:
     
 import re
 
+_INFOS_REQUIRED_FIELDS = (
+    "birth_date",
+    "birth_city",
+    "birth_country",
+    "nationality",
+    "address",
+    "zip_code",
+    "city",
+)
+_NON_DIGIT_RE = re.compile(r"\D+")
+_PRE_NUMBER_RE = re.compile(r"^(PRE|CAR)-\d{3}-\d{4}-\d{2}-\d{2}-\d{11,}$")
+
+
 def infos_is_complete(t: Dict[str, Any]) -> bool:
     # Champs obligatoires
-    required = [
-        "birth_date",
-        "birth_city",
-        "birth_country",
-        "nationality",
-        "address",
-        "zip_code",
-        "city",
-    ]
-    for k in required:
+    for k in _INFOS_REQUIRED_FIELDS:
         if not (t.get(k) or "").strip():
             return False
 
     # Sécu : 15 chiffres
-    secu_digits = re.sub(r"\D+", "", (t.get("carte_vitale") or ""))
+    secu_digits = _NON_DIGIT_RE.sub("", (t.get("carte_vitale") or ""))
     if len(secu_digits) != 15:
         return False
 
     # PRE : format PRE-083-2025-12-01-20250000000 ou CAR-...
     pre = (t.get("pre_number") or "").strip().upper().replace(" ", "")
-    if not re.match(r"^(PRE|CAR)-\d{3}-\d{4}-\d{2}-\d{2}-\d{11,}$", pre):
+    if not _PRE_NUMBER_RE.match(pre):
         return False
 
     return True
 
+
 def dossier_is_complete_total(trainee: Dict[str, Any], training_type: str) -> bool:
     # ✅ complet seulement si infos OK + tous docs CONFORME
     return infos_is_complete(trainee) and dossier_is_complete(trainee, training_type)
@@ -730,8 +1713,37 @@ def home():
     return redirect(url_for("admin_sessions"))
 
 
+# ✅ rendu en flux, par paquets de STREAM_BUFFER_SIZE morceaux (moins de petits writes socket)
+STREAM_BUFFER_SIZE = 10
+
+
+def stream_template_buffered(template_name: str, **context):
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return stream_with_context(stream)
+
+
+# ✅ cache du HTML de chaque carte session : clé = contenu affiché (+ query string des liens)
+_CARD_CACHE: Dict[Any, Markup] = {}
+CARD_CACHE_MAXSIZE = 512
+
+
+def render_session_card(card: Dict[str, Any]) -> Markup:
+    key = (request.query_string, tuple(card.items()))
+    html = _CARD_CACHE.get(key)
+    if html is None:
+        html = Markup(render_template("_session_card.html", s=card))
+        if len(_CARD_CACHE) >= CARD_CACHE_MAXSIZE:
+            _CARD_CACHE.clear()
+        _CARD_CACHE[key] = html
+    return html
+
+
 @app.get("/admin/sessions")
 @admin_login_required
+@etag_by_data_version
 def admin_sessions():
     data = load_data()
     out_sessions = []
@@ -739,38 +1751,28 @@ def admin_sessions():
         if bool(s.get("archived")):
             continue
 
-        trainees = _session_trainees_list(s)
-        st = compute_stats(s)
-
-        # ✅ docs fin de formation : nb de stagiaires COMPLETS / nb stagiaires
-        done_total = 0
-        for t in trainees:
-            _, _, ok = deliverables_progress(t)
-            if ok:
-                done_total += 1
-        
-        total_total = len(trainees)
-
+        summary = session_summary(s)
 
-        out_sessions.append({
+        card = {
             "id": s.get("id"),
             "name": _session_get(s, "name", ""),
             "training_type": _session_get(s, "training_type", ""),
             "date_start": _session_get(s, "date_start", ""),
             "date_end": _session_get(s, "date_end", ""),
             "exam_date": _session_get(s, "exam_date", ""),
-            "total": st["total"],
-            "session_is_conform": st["session_is_conform"],
+            "total": summary["total"],
+            "session_is_conform": summary["session_is_conform"],
 
             # ✅ new
-            "deliverables_done": done_total,
-            "deliverables_total": total_total,
-        })
+            "deliverables_done": summary["deliverables_done"],
+            "deliverables_total": summary["deliverables_total"],
+        }
+        card["card_html"] = render_session_card(card)
+        out_sessions.append(card)
 
     return render_template(
         "admin_sessions.html",
         sessions=out_sessions,
-        formation_types=FORMATION_TYPES,
     )
 
 
@@ -795,63 +1797,53 @@ def admin_trainees(session_id: str):
 
     trainees = _session_trainees_list(s)
 
-    # refresh CNAPS (best-effort) using last_name/first_name
-    for t in trainees:
-        ln = (t.get("last_name") or "").strip()
-        fn = (t.get("first_name") or "").strip()
-
-        # ✅ si déjà validé manuellement, on ne touche pas
-        if (t.get("cnaps") or "").strip().upper() == "CARTE PROFESSIONNELLE OK":
-            pass
-        else:
-            if ln and fn:
-                cn = fetch_cnaps_status_by_name(ln, fn)
-
-                # ✅ n'écrase jamais avec INCONNU
-                if cn:
-                    cn_u = str(cn).strip().upper()
-                    if cn_u not in ("INCONNU", "UNKNOWN", ""):
-                        t["cnaps"] = cn_u
-
-        # valeur par défaut si vide
-        if not (t.get("cnaps") or "").strip():
-            t["cnaps"] = "INCONNU"
-
-        # hosting only for A3P
-        if session_view["training_type"] == "A3P":
-            email = t.get("email") or ""
-            hb = fetch_hebergement_status(email) if email else None
-            t["hosting_status"] = hb if hb else (t.get("hosting_status") or "unknown")
-        else:
-            t.pop("hosting_status", None)
-
-    # persist normalized trainees back into storage
+    # ✅ statuts CNAPS / hébergement : la page s'affiche avec les valeurs stockées,
+    # le rafraîchissement réseau tourne en arrière-plan (?refresh=1 : synchrone, sans cache)
+    dirty = "stagiaires" in s or not isinstance(s.get("trainees"), list)
     s["trainees"] = trainees
     s.pop("stagiaires", None)
-    save_data(data)
-    stats = compute_stats(s)
+    if request.args.get("refresh") == "1":
+        if refresh_trainees_external_status(trainees, session_view["training_type"], refresh=True):
+            dirty = True
+    else:
+        start_background_session_refresh(session_id)
+    # ✅ écriture disque seulement si quelque chose de stocké a réellement changé
+    if dirty:
+        save_data(data)
+
+    # ✅ rien n'a bougé depuis le dernier affichage -> 304 (le refresh en arrière-plan est déjà lancé)
+    etag = data_etag()
+    if not_modified(etag):
+        return with_etag(("", 304), etag)
+
+    stats = session_summary_stats(s)
     show_hosting = (session_view["training_type"] == "A3P")
     show_vae = (session_view["training_type"] == "DIRIGEANT VAE")
 
-     # ✅ docs fin de formation par stagiaire (pour surlignage + n/3)
+    # ✅ docs fin de formation par stagiaire (pour surlignage + n/3) : champs d'affichage
+    # posés sur des copies, jamais sur les stagiaires stockés
+    trainees_view = []
     for t in trainees:
-        t.setdefault("deliverables", {})
         d_done, d_total, d_ok = deliverables_progress(t)
-        t["deliverables_done"] = d_done
-        t["deliverables_total"] = d_total
-        t["deliverables_ok"] = d_ok
-        t["deliverables_text"] = f"{d_done}/{d_total}"
-
-
-    return render_template(
+        trainees_view.append(dict(
+            t,
+            deliverables=t.get("deliverables") or {},
+            deliverables_done=d_done,
+            deliverables_total=d_total,
+            deliverables_ok=d_ok,
+            deliverables_text=f"{d_done}/{d_total}",
+        ))
+
+
+    # ✅ tableau potentiellement long : envoyé au fil du rendu (pas de gros buffer)
+    return with_etag(app.response_class(stream_template_buffered(
         "admin_trainees.html",
         session=session_view,
-        trainees=trainees,
+        trainees=trainees_view,
         stats=stats,
         show_hosting=show_hosting,
         show_vae=show_vae,
-        enums=ENUMS,
-    )
+    )), etag)
 
 
 # =========================
@@ -868,7 +1860,7 @@ def admin_trainees(session_id: str):
 @admin_login_required
 def api_create_session():
     data = load_data()
-    payload = request.get_json(silent=True) or {}
+    payload = request_json()
 
     name = (payload.get("name") or "").strip()
     training_type = (payload.get("training_type") or "").strip()
@@ -879,7 +1871,7 @@ def api_create_session():
     if not name or not training_type:
         return jsonify({"ok": False, "error": "missing_name_or_training_type"}), 400
 
-    session_id = uuid.uuid4().hex[:10]
+    session_id = secrets.token_hex(5)
     s = {
         "id": session_id,
         "name": name,
@@ -902,6 +1894,9 @@ def api_delete_session(session_id: str):
     data = load_data()
     before = len(data.get("sessions", []))
     data["sessions"] = [s for s in data.get("sessions", []) if s.get("id") != session_id]
+    with _LOCK:
+        _TRAINEE_IDX["by_session"].pop(session_id, None)
+    _SESSION_SUMMARY_CACHE.pop(session_id, None)
     save_data(data)
     return jsonify({"ok": True, "deleted": (len(data["sessions"]) != before)})
 
@@ -938,6 +1933,75 @@ def api_unarchive_session(session_id: str):
 # API - Trainees (create + update for autosave)
 # =========================
 
+# ✅ mail + SMS de bienvenue : squelettes construits une seule fois, seuls les champs varient
+WELCOME_EMAIL_TEMPLATE = string.Template("""
+          <h2 style="text-align:center">🎉 Confirmation d’inscription</h2>
+          <p>Bonjour <strong>${first_name}</strong>,</p>
+          <p>
+            Je vous confirme que vous êtes inscrit(e) en formation
+            <strong>${formation_type}</strong>, qui se déroulera
+            du <strong>${dstart}</strong> au <strong>${dend}</strong>.
+          </p>
+          <p>Je vous remercie pour votre confiance !</p>
+          <p>
+            Vous recevrez prochainement par mail votre <strong>Contrat de formation</strong>
+            que je vous invite à signer dès réception (signature électronique).
+          </p>
+          <p>
+            📂 Je vous remercie de bien vouloir compléter dès que possible votre
+            <strong>Dossier Formation</strong> depuis votre Espace Stagiaire en cliquant sur le bouton ci-dessous.
+          </p>
+          <p style="color:#b91c1c;font-weight:bold">
+            ⚠️ Attention : votre dossier doit être complet au plus tard <u>10 jours avant le début de votre formation</u> !
+          </p>
+
+          <p style="text-align:center">
+            <a href="${link}"
+               style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
+              👉 Accéder à mon espace stagiaire
+            </a>
+          </p>
+
+          <p style="margin-top:25px">
+            ☎️ Pour tous renseignements, vous pouvez nous contacter au <strong>04 22 47 07 68</strong>
+            ou utiliser notre formulaire d’assistance :
+          </p>
+
+          <p style="text-align:center">
+            <a href="https://assistance-alw9.onrender.com/"
+               style="display:inline-block;background:#2563eb;color:white;padding:10px 16px;border-radius:10px;text-decoration:none;font-weight:bold">
+              🛠️ Formulaire d’assistance
+            </a>
+          </p>
+
+          <p style="margin-top:30px">
+            Je reste à votre disposition pour tous renseignements complémentaires,<br>
+            <strong>Clément VAILLANT</strong><br>
+            Directeur Intégrale Academy
+          </p>
+
+          <hr style="margin:30px 0;border:none;border-top:1px solid #e5e7eb">
+
+          <p style="font-size:12px;color:#6b7280;text-align:center;line-height:1.6">
+            © Intégrale Academy — Merci de votre confiance 💛<br>
+            54 chemin du Carreou 83480 PUGET SUR ARGENS / 142 rue de Rivoli 75001 PARIS<br>
+            SIREN 840 899 884 - NDA 93830600283 - Certification Nationale QUALIOPI : n°03169 en date du 21/10/2024<br>
+            UAI Côte d'Azur 0831774C - UAI Paris 0756548K<br>
+            <a href="https://www.integraleacademy.com" style="color:#1f8f4a;text-decoration:none;font-weight:bold">
+              integraleacademy.com
+            </a>
+          </p>
+""")
+
+WELCOME_SMS_TEMPLATE = string.Template(
+    "Intégrale Academy 🎓 Bonjour ${first_name}, Votre inscription en formation ${formation_type} est confirmée. "
+    "(${dstart} au ${dend}). Vous allez prochainement recevoir par mail votre Contrat de formation (signature électronique). "
+    "Vous devez à présent compléter votre Dossier Formation : ${link} "
+    "(votre dossier doit être COMPLET au plus tard 10 jours avant votre entrée en formation). "
+    "Pour toute demande d'assistance vous pouvez nous contacter au 04 22 47 07 68."
+)
+
+
 @app.post("/api/sessions/<session_id>/trainees/create")
 @admin_login_required
 def api_create_trainee(session_id: str):
@@ -946,7 +2010,7 @@ def api_create_trainee(session_id: str):
     if not s:
         return jsonify({"ok": False, "error": "session_not_found"}), 404
 
-    payload = request.get_json(silent=True) or {}
+    payload = request_json()
     last_name = (payload.get("last_name") or "").strip()
     first_name = (payload.get("first_name") or "").strip()
     email = (payload.get("email") or "").strip()
@@ -960,13 +2024,13 @@ def api_create_trainee(session_id: str):
     if not last_name or not first_name:
         return jsonify({"ok": False, "error": "missing_name"}), 400
 
-    trainee_id = "TRN-" + uuid.uuid4().hex[:8].upper()
+    trainee_id = "TRN-" + secrets.token_hex(4).upper()
 
     training_type = _session_get(s, "training_type", "")
     show_hosting = (training_type == "A3P")
     show_vae = (training_type == "DIRIGEANT VAE")
 
-    public_token = uuid.uuid4().hex
+    public_token = secrets.token_hex(16)
 
     t = {
         "id": trainee_id,
@@ -1009,79 +2073,26 @@ def api_create_trainee(session_id: str):
 
         subject = "Votre inscription en formation – Intégrale Academy"
 
-        html = mail_layout(f"""
-          <h2 style="text-align:center">🎉 Confirmation d’inscription</h2>
-          <p>Bonjour <strong>{first_name}</strong>,</p>
-          <p>
-            Je vous confirme que vous êtes inscrit(e) en formation
-            <strong>{formation_type}</strong>, qui se déroulera
-            du <strong>{dstart}</strong> au <strong>{dend}</strong>.
-          </p>
-          <p>Je vous remercie pour votre confiance !</p>
-          <p>
-            Vous recevrez prochainement par mail votre <strong>Contrat de formation</strong>
-            que je vous invite à signer dès réception (signature électronique).
-          </p>
-          <p>
-            📂 Je vous remercie de bien vouloir compléter dès que possible votre
-            <strong>Dossier Formation</strong> depuis votre Espace Stagiaire en cliquant sur le bouton ci-dessous.
-          </p>
-          <p style="color:#b91c1c;font-weight:bold">
-            ⚠️ Attention : votre dossier doit être complet au plus tard <u>10 jours avant le début de votre formation</u> !
-          </p>
-
-          <p style="text-align:center">
-            <a href="{link}"
-               style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
-              👉 Accéder à mon espace stagiaire
-            </a>
-          </p>
-
-          <p style="margin-top:25px">
-            ☎️ Pour tous renseignements, vous pouvez nous contacter au <strong>04 22 47 07 68</strong>
-            ou utiliser notre formulaire d’assistance :
-          </p>
-
-          <p style="text-align:center">
-            <a href="https://assistance-alw9.onrender.com/"
-               style="display:inline-block;background:#2563eb;color:white;padding:10px 16px;border-radius:10px;text-decoration:none;font-weight:bold">
-              🛠️ Formulaire d’assistance
-            </a>
-          </p>
-
-          <p style="margin-top:30px">
-            Je reste à votre disposition pour tous renseignements complémentaires,<br>
-            <strong>Clément VAILLANT</strong><br>
-            Directeur Intégrale Academy
-          </p>
-
-          <hr style="margin:30px 0;border:none;border-top:1px solid #e5e7eb">
+        html = mail_layout(WELCOME_EMAIL_TEMPLATE.substitute(
+            first_name=_h(first_name), formation_type=_h(formation_type), dstart=_h(dstart), dend=_h(dend), link=link,
+        ))
 
-          <p style="font-size:12px;color:#6b7280;text-align:center;line-height:1.6">
-            © Intégrale Academy — Merci de votre confiance 💛<br>
-            54 chemin du Carreou 83480 PUGET SUR ARGENS / 142 rue de Rivoli 75001 PARIS<br>
-            SIREN 840 899 884 - NDA 93830600283 - Certification Nationale QUALIOPI : n°03169 en date du 21/10/2024<br>
-            UAI Côte d'Azur 0831774C - UAI Paris 0756548K<br>
-            <a href="https://www.integraleacademy.com" style="color:#1f8f4a;text-decoration:none;font-weight:bold">
-              integraleacademy.com
-            </a>
-          </p>
-        """)
-
-        sms = (
-            f"Intégrale Academy 🎓 Bonjour {first_name}, Votre inscription en formation {formation_type} est confirmée. "
-            f"({dstart} au {dend}). Vous allez prochainement recevoir par mail votre Contrat de formation (signature électronique). "
-            f"Vous devez à présent compléter votre Dossier Formation : {link} "
-            f"(votre dossier doit être COMPLET au plus tard 10 jours avant votre entrée en formation). "
-            f"Pour toute demande d'assistance vous pouvez nous contacter au 04 22 47 07 68."
+        sms = WELCOME_SMS_TEMPLATE.substitute(
+            first_name=first_name, formation_type=formation_type, dstart=dstart, dend=dend, link=link,
         )
 
-        email_ok = brevo_send_email(email, subject, html) if email else False
-        sms_ok = brevo_send_sms(phone, sms) if phone else False
+        # ✅ email de bienvenue : mis en file et regroupé avec les autres créations
+        email_ok = enqueue_brevo_email(email, subject, html)
+
+        # ✅ SMS envoyé en arrière-plan : la réponse n'attend pas Brevo, le résultat est noté après coup
+        # (y compris s'il part après un redémarrage, depuis l'outbox)
+        sms_ok = brevo_send_sms_async(phone, sms, stamp={
+            "session_id": session_id, "trainee_id": trainee_id, "field": "access_sent_sms_ok",
+        })
 
         t["access_sent_at"] = _now_iso()
         t["access_sent_email_ok"] = bool(email_ok)
-        t["access_sent_sms_ok"] = bool(sms_ok)
+        t.setdefault("access_sent_sms_ok", False)
     else:
         # pas d'envoi maintenant
         email_ok = False
@@ -1104,6 +2115,58 @@ def api_create_trainee(session_id: str):
 
 
 
+_ALLOWED_UPDATE_KEYS = frozenset({
+    "convention_status",
+    "test_fr_status",
+    "dossier_status",
+    "financement_status",
+    "vae_status",
+    "comment",
+    "financement_comment",
+    "vae_status_label",
+    "cnaps",
+    "no_permis",
+    "public_hide_infos",
+    "public_hide_docs",
+})
+_BOOL_UPDATE_KEYS = frozenset({"no_permis", "public_hide_infos", "public_hide_docs"})
+
+
+def _apply_trainee_updates(t: Dict[str, Any], payload: Dict[str, Any]) -> None:
+    # Your template uses:
+    # - convention_status, test_fr_status, dossier_status, financement_status, vae_status, comment, cnaps
+    updates = {k: v for k, v in payload.items() if k in _ALLOWED_UPDATE_KEYS}
+
+    # ✅ champs bool
+    for k in _BOOL_UPDATE_KEYS.intersection(updates):
+        updates[k] = updates[k] in (True, "true", "1", 1, "yes", "on")
+
+    if "cnaps" in updates:
+        updates["cnaps"] = _normalize_cnaps(updates["cnaps"])
+
+    t.update(updates)
+
+
+def _apply_doc_updates(t: Dict[str, Any], items: List[Any]) -> bool:
+    """Applique [{key, status?, comment?}, ...] ; True si un statut a changé (complétude à recalculer)."""
+    by_key = docs_by_key(t)
+    status_changed = False
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        d = by_key.get(item.get("key"))
+        if d is None:
+            continue
+        if "status" in item:
+            st = canonical_doc_status(item["status"])
+            status_changed = status_changed or d.get("status") != st
+            d["status"] = st
+        if "comment" in item:
+            d["comment"] = item["comment"]
+    return status_changed
+
+
+# ⚠️ conservé pour compatibilité : la fiche stagiaire regroupe ses sauvegardes via /batch-update
 @app.post("/api/sessions/<session_id>/stagiaires/<trainee_id>/update")
 @admin_login_required
 def api_update_trainee(session_id: str, trainee_id: str):
@@ -1113,51 +2176,70 @@ def api_update_trainee(session_id: str, trainee_id: str):
         return jsonify({"ok": False, "error": "session_not_found"}), 404
 
     trainees = _session_trainees_list(s)
-    t = None
-    for x in trainees:
-        if x.get("id") == trainee_id:
-            t = x
-            break
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         return jsonify({"ok": False, "error": "trainee_not_found"}), 404
 
-    payload = request.get_json(silent=True) or {}
+    _apply_trainee_updates(t, request_json())
 
-    # Your template uses:
-    # - convention_status, test_fr_status, dossier_status, financement_status, vae_status, comment, cnaps
-    allowed = {
-        "convention_status",
-        "test_fr_status",
-        "dossier_status",
-        "financement_status",
-        "vae_status",
-        "comment",
-        "financement_comment",
-        "vae_status_label",
-        "cnaps",
-        "no_permis", 
-        "public_hide_infos",
-        "public_hide_docs",
-    }
+    t["updated_at"] = _now_iso()
+    s["trainees"] = trainees
+    s.pop("stagiaires", None)
+    training_type = _session_get(s, "training_type", "")
+    t["dossier_status"] = "complete" if dossier_is_complete_total(t, training_type) else "incomplete"
+    save_data(data)
 
-    for k, v in payload.items():
-        if k not in allowed:
-            continue
-    
-        # ✅ champs bool
-        if k in ("no_permis", "public_hide_infos", "public_hide_docs"):
-            t[k] = True if v in (True, "true", "1", 1, "yes", "on") else False
-        else:
-            t[k] = v
+    # ✅ renvoie de quoi mettre la page à jour sans la recharger
+    return jsonify({
+        "ok": True,
+        "dossier_status": t["dossier_status"],
+        "trainee_is_conform": trainee_is_conform(t, training_type),
+        "stats": session_summary_stats(s),
+    })
+
+
+@app.post("/api/sessions/<session_id>/stagiaires/<trainee_id>/batch-update")
+@admin_login_required
+def api_batch_update(session_id: str, trainee_id: str):
+    """
+    Plusieurs modifications en une requête : {"trainee": {champ: valeur}, "documents": [{key, status?, comment?}]}.
+    Un seul recalcul du statut dossier et un seul save_data.
+    """
+    data = load_data()
+    s = find_session(data, session_id)
+    if not s:
+        return jsonify({"ok": False, "error": "session_not_found"}), 404
+
+    trainees = _session_trainees_list(s)
+    t = find_trainee(s, trainee_id, trainees)
+    if not t:
+        return jsonify({"ok": False, "error": "trainee_not_found"}), 404
+
+    payload = request_json()
+    fields = payload.get("trainee") or {}
+    doc_items = payload.get("documents") or []
+    if not isinstance(fields, dict) or not isinstance(doc_items, list):
+        return jsonify({"ok": False, "error": "invalid_payload"}), 400
 
+    _apply_trainee_updates(t, fields)
+    status_changed = _apply_doc_updates(t, doc_items)
 
     t["updated_at"] = _now_iso()
+    training_type = _session_get(s, "training_type", "")
+    # (des commentaires seuls ne changent pas la complétude)
+    if fields or status_changed or t.get("dossier_status") not in ("complete", "incomplete"):
+        t["dossier_status"] = "complete" if dossier_is_complete_total(t, training_type) else "incomplete"
+
     s["trainees"] = trainees
     s.pop("stagiaires", None)
-    training_type = _session_get(s, "training_type", "")
-    t["dossier_status"] = "complete" if dossier_is_complete_total(t, training_type) else "incomplete"
     save_data(data)
-    return jsonify({"ok": True})
+
+    return jsonify({
+        "ok": True,
+        "dossier_status": t["dossier_status"],
+        "trainee_is_conform": trainee_is_conform(t, training_type),
+        "stats": session_summary_stats(s),
+    })
 
 
 @app.post("/api/sessions/<session_id>/trainees/<trainee_id>/delete")
@@ -1189,8 +2271,13 @@ def api_cnaps_lookup():
     if not nom or not prenom:
         return jsonify({"ok": False, "error": "missing_nom_or_prenom"}), 400
 
-    status = fetch_cnaps_status_by_name(nom, prenom) or "INCONNU"
-    return jsonify({"ok": True, "nom": nom, "prenom": prenom, "statut_cnaps": str(status).upper()})
+    # ✅ bouton "rafraîchir" : on ignore le cache, le résultat frais le remet à jour
+    status = fetch_cnaps_status_by_name(nom, prenom, refresh=True) or "INCONNU"
+    resp = jsonify({"ok": True, "nom": nom, "prenom": prenom, "statut_cnaps": _normalize_cnaps(status)})
+    # ✅ bouton « rafraîchir » : jamais servi depuis le cache navigateur
+    # (double-clic / plusieurs onglets : déjà regroupés côté serveur par _ttl_cache)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 
 # =========================
@@ -1199,7 +2286,19 @@ def api_cnaps_lookup():
 
 @app.get("/api/health")
 def health():
-    return jsonify({"ok": True, "data_file": DATA_FILE})
+    # ✅ ?force=1 : écrit immédiatement le cache mémoire sur disque
+    if request.args.get("force") == "1":
+        _flush_to_disk()
+    return jsonify({"ok": True, "data_file": DATA_FILE, "dirty": _DIRTY})
+
+
+@app.get("/admin/debug/dump")
+@admin_login_required
+def admin_debug_dump():
+    # ✅ data.json indenté à la demande (le fichier sur disque est compact)
+    with _LOCK:
+        raw = orjson.dumps(load_data(), option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return app.response_class(raw, mimetype="application/json")
 
 from werkzeug.utils import secure_filename
 
@@ -1208,11 +2307,38 @@ from werkzeug.utils import secure_filename
 # =========================
 # Upload helpers
 # =========================
-ALLOWED_EXT = {".pdf",".png",".jpg",".jpeg",".doc",".docx",".webp"}
+ALLOWED_EXT = frozenset({".pdf",".png",".jpg",".jpeg",".doc",".docx",".webp"})
+
+# ✅ signatures (premiers octets) attendues pour chaque extension acceptée
+_PDF_MAGIC = (b"%PDF",)
+_JPG_MAGIC = (b"\xff\xd8\xff",)
+_UPLOAD_MAGIC: Dict[str, Tuple[bytes, ...]] = {
+    ".pdf": _PDF_MAGIC,
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".jpg": _JPG_MAGIC,
+    ".jpeg": _JPG_MAGIC,
+    ".webp": (b"RIFF",),
+    ".docx": (b"PK\x03\x04",),
+    ".doc": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",),  # conteneur OLE (Word 97-2003)
+}
+_ALL_UPLOAD_MAGIC = tuple({m for ms in _UPLOAD_MAGIC.values() for m in ms})
 
 def _safe_ext(filename: str) -> str:
     return os.path.splitext(filename)[1].lower()
 
+def _magic_ok(stream, ext: str) -> bool:
+    """Vérifie les 8 premiers octets du fichier (sans extension : n'importe quelle signature connue)."""
+    pos = stream.tell()
+    head = stream.read(8)
+    stream.seek(pos)
+    if ext == ".webp" and head.startswith(b"RIFF"):
+        # RIFF....WEBP : on confirme le type de conteneur
+        stream.seek(pos + 8)
+        kind = stream.read(4)
+        stream.seek(pos)
+        return kind == b"WEBP"
+    return head.startswith(_UPLOAD_MAGIC.get(ext, _ALL_UPLOAD_MAGIC))
+
 def _store_file(session_id: str, trainee_id: str, folder: str, f) -> str:
     base = trainee_upload_dir(session_id, trainee_id)
     target_dir = os.path.join(base, folder)
@@ -1222,12 +2348,57 @@ def _store_file(session_id: str, trainee_id: str, folder: str, f) -> str:
     ext = _safe_ext(filename)
     if ext and ext not in ALLOWED_EXT:
         raise ValueError("extension_not_allowed")
+    if not _magic_ok(f.stream, ext):
+        raise ValueError("bad_magic")
 
-    name = uuid.uuid4().hex[:10] + (ext or "")
+    name = secrets.token_hex(5) + (ext or "")
     path = os.path.join(target_dir, name)
-    f.save(path)
+    _write_upload(f.stream, path)
     return path
 
+
+UPLOAD_COPY_BUFFER = 1 << 20
+UPLOAD_CACHE_MAX_AGE = 3600
+
+
+def _upload_fd(stream) -> Optional[int]:
+    """Descripteur du fichier temporaire de l'upload (gros fichiers), sinon None (upload resté en mémoire)."""
+    if isinstance(stream, tempfile.SpooledTemporaryFile) and not getattr(stream, "_rolled", False):
+        return None
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, UnsupportedOperation):
+        return None
+
+
+def _write_upload(stream, path: str) -> None:
+    """
+    Copie l'upload vers `path` sans passer par des petits tampons :
+    fichier temporaire -> os.sendfile (copie dans le noyau) ; sinon copie par blocs de 1 Mo.
+    Pas de fsync : un upload perdu sur crash est simplement redéposé.
+    """
+    src_fd = _upload_fd(stream)
+    if src_fd is not None:
+        start = offset = stream.tell()
+        remaining = os.fstat(src_fd).st_size - offset
+        dst_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            while remaining > 0:
+                sent = os.sendfile(dst_fd, src_fd, offset, remaining)
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+            return
+        except OSError:
+            # sendfile refusé (système de fichiers / plateforme) : copie classique depuis le début
+            stream.seek(start)
+        finally:
+            os.close(dst_fd)
+
+    with open(path, "wb") as out:
+        shutil.copyfileobj(stream, out, UPLOAD_COPY_BUFFER)
+
 def _tokenize_path(path: str) -> str:
     # on ne renvoie pas le chemin réel au template
     # token = path relatif à PERSIST_DIR
@@ -1242,10 +2413,22 @@ def _detokenize_path(token: str) -> str:
 @admin_login_required
 def admin_view_upload(path: str):
     full = _detokenize_path(path)
-    if not os.path.exists(full):
+    try:
+        st = os.stat(full)
+    except OSError:
         abort(404)
-    # simple serve
-    return send_file(full, as_attachment=False)
+    # ✅ fichiers jamais réécrits (nom aléatoire) : ETag mtime+taille, revisite = 304 sans renvoyer le PDF
+    resp = send_file(
+        full,
+        as_attachment=False,
+        conditional=True,
+        etag=f"{st.st_mtime_ns:x}-{st.st_size:x}",
+        last_modified=st.st_mtime,
+        max_age=UPLOAD_CACHE_MAX_AGE,
+    )
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    return resp
 
 @app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/documents/<doc_key>/upload")
 @admin_login_required
@@ -1256,7 +2439,7 @@ def admin_upload_doc_file(session_id: str, trainee_id: str, doc_key: str):
         abort(404)
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
@@ -1267,41 +2450,36 @@ def admin_upload_doc_file(session_id: str, trainee_id: str, doc_key: str):
 
     # ✅ refuse les doc_key inconnus pour cette formation
     if doc_key not in allowed_doc_keys_for_training(training_type):
-        return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
+        return trainee_action_done(session_id, trainee_id, error="unknown_doc_key")
 
     f = request.files.get("file")
     if not f or not f.filename:
-        return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
+        return trainee_action_done(session_id, trainee_id, error="missing_file")
 
     try:
         stored = _store_file(session_id, trainee_id, "documents", f)
     except Exception:
-        return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
+        return trainee_action_done(session_id, trainee_id, error="store_failed")
 
     token = _tokenize_path(stored)
 
-    docs = t.get("documents") or []
-    for d in docs:
-        if d.get("key") == doc_key:
-            cur_files = d.get("files")
-            if not isinstance(cur_files, list):
-                cur_files = []
+    d = docs_by_key(t).get(doc_key)
+    if d is not None:
+        cur_files = d.get("files")
+        if not isinstance(cur_files, list):
+            cur_files = []
 
-            old = (d.get("file") or "").strip()
-            if old and old not in cur_files:
-                cur_files.append(old)
+        old = (d.get("file") or "").strip()
+        if old and old not in cur_files:
+            cur_files.append(old)
 
-            cur_files.append(token)
+        cur_files.append(token)
 
-            d["files"] = cur_files
-            d["file"] = cur_files[0] if cur_files else ""
+        d["files"] = cur_files
+        d["file"] = cur_files[0] if cur_files else ""
 
-            cur = (d.get("status") or "").strip().upper()
-            if cur in ("", "NON DÉPOSÉ", "NON DEPOSE", "NON_DEPOSE"):
-                d["status"] = "A CONTRÔLER"
-            if d.get("status") == "A CONTROLER":
-                d["status"] = "A CONTRÔLER"
-            break
+        cur = canonical_doc_status(d.get("status"))
+        d["status"] = DOC_STATUS_A_CONTROLER if cur == DOC_STATUS_NON_DEPOSE else cur
 
     t["updated_at"] = _now_iso()
 
@@ -1312,7 +2490,11 @@ def admin_upload_doc_file(session_id: str, trainee_id: str, doc_key: str):
     s.pop("stagiaires", None)
     save_data(data)
 
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
+    return trainee_action_done(
+        session_id, trainee_id,
+        dossier_status=t["dossier_status"],
+        **{f"doc_{doc_key}": url_for("admin_view_upload", path=token)},
+    )
 
 @app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/documents/<doc_key>/delete")
 @admin_login_required
@@ -1323,7 +2505,7 @@ def admin_delete_doc_file(session_id: str, trainee_id: str, doc_key: str):
         abort(404)
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
@@ -1334,8 +2516,7 @@ def admin_delete_doc_file(session_id: str, trainee_id: str, doc_key: str):
     if doc_key not in allowed_doc_keys_for_training(training_type):
         return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
 
-    docs = t.get("documents") or []
-    target = next((d for d in docs if d.get("key") == doc_key), None)
+    target = docs_by_key(t).get(doc_key)
     if not target:
         return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
 
@@ -1360,7 +2541,7 @@ def admin_delete_doc_file(session_id: str, trainee_id: str, doc_key: str):
     # reset du doc
     target["file"] = ""
     target["files"] = []
-    target["status"] = "NON DÉPOSÉ"
+    target["status"] = DOC_STATUS_NON_DEPOSE
     # on garde le commentaire (pratique), ou tu peux le vider si tu préfères
 
     t["updated_at"] = _now_iso()
@@ -1382,16 +2563,25 @@ def admin_delete_doc_file(session_id: str, trainee_id: str, doc_key: str):
 # =========================
 
 
-def docs_summary_text(trainee: Dict[str, Any]) -> str:
-    lines=[]
+def docs_summary_html(trainee: Dict[str, Any]) -> str:
+    """
+    Détail des documents pour le bloc <pre> des mails, déjà échappé :
+    chaque morceau est échappé au passage et le tout assemblé en un seul join.
+    """
+    parts = []
+    add = parts.append
     for d in (trainee.get("documents") or []):
-        st = (d.get("status") or "A CONTRÔLER").upper()
+        if parts:
+            add("\n")
+        add("- ")
+        add(_h(d.get("label", "document")))
+        add(" : ")
+        add(_h(d.get("status") or DOC_STATUS_A_CONTROLER))
         com = (d.get("comment") or "").strip()
         if com:
-            lines.append(f"- {d.get('label','document')} : {st} — {com}")
-        else:
-            lines.append(f"- {d.get('label','document')} : {st}")
-    return "\n".join(lines)
+            add(" — ")
+            add(_h(com))
+    return "".join(parts)
 
 
 import re
@@ -1453,40 +2643,67 @@ def admin_delete_trainee(session_id: str, trainee_id: str):
     save_data(data)
     return redirect(url_for("admin_trainees", session_id=session_id))
 
+# ✅ placeholders {{CLE}} des modèles Word : une seule regex, un seul passage par texte
+_DOCX_PLACEHOLDER_RE = re.compile(r"\{\{[A-Z_]+\}\}")
+_DOCX_PLACEHOLDER_RE_B = re.compile(rb"\{\{[A-Z_]+\}\}")
+_W_T = qn("w:t")
+
+
 def _replace_in_docx(doc: Document, replacements: dict) -> None:
-    def replace_in_paragraph(p):
-        # Remplace dans les runs pour garder le style
-        for run in p.runs:
-            for k, v in replacements.items():
-                if k in run.text:
-                    run.text = run.text.replace(k, v)
+    """
+    Remplace les {{CLES}} dans chaque <w:t> (corps, tableaux, en-têtes, pieds de page) : le style des runs est conservé.
+    Les clés absentes de `replacements` (ex. {{PHOTO}}) sont laissées telles quelles.
+    """
+    def sub(m):
+        return replacements.get(m.group(0), m.group(0))
 
-    def replace_in_table(table):
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    replace_in_paragraph(p)
-                for t2 in cell.tables:
-                    replace_in_table(t2)
+    roots = [doc.element.body]
+    for section in doc.sections:
+        roots.append(section.header._element)
+        roots.append(section.footer._element)
 
-    # Corps du document
-    for p in doc.paragraphs:
-        replace_in_paragraph(p)
+    for root in roots:
+        for el in root.iter(_W_T):
+            if el.text and "{{" in el.text:
+                el.text = _DOCX_PLACEHOLDER_RE.sub(sub, el.text)
 
-    for table in doc.tables:
-        replace_in_table(table)
 
-    # En-têtes / pieds de page
-    for section in doc.sections:
-        for p in section.header.paragraphs:
-            replace_in_paragraph(p)
-        for table in section.header.tables:
-            replace_in_table(table)
+# ✅ modèles Word gardés en mémoire (invalidés si le fichier change sur disque)
+_DOCX_TEMPLATE_CACHE: Dict[str, Tuple[float, bytes, List[Tuple[zipfile.ZipInfo, bytes]]]] = {}
+_DOCX_TEXT_PARTS = ("word/document.xml", "word/header", "word/footer")
+
+
+def _docx_template(path: str) -> Tuple[bytes, List[Tuple[zipfile.ZipInfo, bytes]]]:
+    """(octets du .docx, [(entrée zip, contenu)]) — lus une fois par version du fichier."""
+    mtime = os.path.getmtime(path)
+    hit = _DOCX_TEMPLATE_CACHE.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1], hit[2]
+    with open(path, "rb") as f:
+        raw = f.read()
+    with zipfile.ZipFile(BytesIO(raw)) as z:
+        parts = [(info, z.read(info)) for info in z.infolist()]
+    _DOCX_TEMPLATE_CACHE[path] = (mtime, raw, parts)
+    return raw, parts
+
+
+def _render_docx_template(path: str, replacements: Dict[str, str]) -> bytes:
+    """
+    Remplace les {{CLES}} directement dans le XML du modèle (corps, en-têtes, pieds de page).
+    Les placeholders des modèles sont d'un seul tenant dans le XML : pas besoin de python-docx.
+    """
+    reps = {k.encode("utf-8"): xml_escape(v).encode("utf-8") for k, v in replacements.items()}
 
-        for p in section.footer.paragraphs:
-            replace_in_paragraph(p)
-        for table in section.footer.tables:
-            replace_in_table(table)
+    def sub(m):
+        return reps.get(m.group(0), m.group(0))
+
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as out:
+        for info, raw in _docx_template(path)[1]:
+            if reps and info.filename.startswith(_DOCX_TEXT_PARTS) and b"{{" in raw:
+                raw = _DOCX_PLACEHOLDER_RE_B.sub(sub, raw)
+            out.writestr(info, raw)
+    return buf.getvalue()
 
 
 @app.get("/admin/sessions/<session_id>/stagiaires/<trainee_id>/etiquette.docx")
@@ -1497,7 +2714,7 @@ def admin_etiquette_docx(session_id: str, trainee_id: str):
         abort(404)
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
@@ -1521,10 +2738,7 @@ def admin_etiquette_docx(session_id: str, trainee_id: str):
     if not os.path.exists(template_path):
         abort(500, f"Fichier Word manquant : {template_name} (dans /templates_word)")
 
-    # 2) Ouvrir le modèle
-    doc = Document(template_path)
-
-    # 3) Remplacements
+    # 2) Remplacements
     replacements = {
         "{{NOM}}": (t.get("last_name", "") or "").upper(),
         "{{PRENOM}}": (t.get("first_name", "") or "").upper(),
@@ -1533,22 +2747,22 @@ def admin_etiquette_docx(session_id: str, trainee_id: str):
         "{{DATES}}": f"{fr_date(_session_get(s,'date_start',''))} → {fr_date(_session_get(s,'date_end',''))}",
     }
 
-    _replace_in_docx(doc, replacements)
-
-    # ✅ Photo identité dans l'étiquette (même taille, sans déformation)
     photo_token = (t.get("identity_photo") or "").strip()
     if photo_token:
+        # ✅ Photo identité dans l'étiquette (même taille, sans déformation) : python-docx
+        doc = Document(BytesIO(_docx_template(template_path)[0]))
+        _replace_in_docx(doc, replacements)
         photo_path = _detokenize_path(photo_token)
         _insert_label_photo(doc, "{{PHOTO}}", photo_path, width_cm=5.41, height_cm=6.41)
+        buf = BytesIO()
+        doc.save(buf)
+        buf.seek(0)
     else:
-        # si pas de photo, on enlève le placeholder
-        _replace_in_docx(doc, {"{{PHOTO}}": ""})
-
-    # 4) Télécharger
-    buf = BytesIO()
-    doc.save(buf)
-    buf.seek(0)
+        # si pas de photo, on enlève le placeholder (remplacement direct dans le XML)
+        replacements["{{PHOTO}}"] = ""
+        buf = BytesIO(_render_docx_template(template_path, replacements))
 
+    # 3) Télécharger
     filename = f"etiquette_{t.get('last_name','')}_{t.get('first_name','')}.docx".replace(" ", "_")
     return send_file(
         buf,
@@ -1625,76 +2839,27 @@ def _insert_label_photo(doc: Document, placeholder: str, photo_path: str, width_
     return inserted
 
 
-@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/send-access")
-@admin_login_required
-def admin_send_access(session_id: str, trainee_id: str):
-    data = load_data()
-    s = find_session(data, session_id)
-    if not s:
-        abort(404)
-    trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
-    if not t:
-        abort(404)
-
-    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
-    subject = "Accès à votre espace stagiaire – Intégrale Academy"
-
-    html = mail_layout(f"""
+# ✅ mails / SMS d'accès et du test de français : squelettes construits une seule fois
+SEND_ACCESS_EMAIL_TEMPLATE = string.Template("""
       <h2>Votre espace stagiaire est disponible</h2>
-      <p>Formation : <strong>{_session_get(s,'name','')}</strong></p>
+      <p>Formation : <strong>${session_name}</strong></p>
       <p>
-        <a href="{link}" style="display:inline-block;background:#1f8f4a;color:white;padding:10px 14px;border-radius:10px;text-decoration:none">
+        <a href="${link}" style="display:inline-block;background:#1f8f4a;color:white;padding:10px 14px;border-radius:10px;text-decoration:none">
           Accéder à mon espace stagiaire
         </a>
       </p>
     """)
 
-    sms = f"Intégrale Academy : votre espace stagiaire est disponible : {link}"
-
-    brevo_send_email(t.get("email", ""), subject, html)
-    brevo_send_sms(t.get("phone", ""), sms)
-
-    t["access_sent_at"] = _now_iso()
-    s["trainees"] = trainees
-    save_data(data)
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-
-# =========================
-# Test de français — notify/relance
-# =========================
-@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/test-fr/notify")
-@admin_login_required
-def admin_test_fr_notify(session_id: str, trainee_id: str):
-    code = (request.form.get("code") or "").strip()
-    deadline = (request.form.get("deadline") or "").strip()
-    if not code or not deadline:
-        return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-
-    data = load_data()
-    s = find_session(data, session_id)
-    if not s:
-        abort(404)
-    trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id")==trainee_id), None)
-    if not t:
-        abort(404)
-
-    link = "https://testb1.lapreventionsecurite.org/Public/"
-    subject = "Test de français à réaliser – Intégrale Academy"
+SEND_ACCESS_SMS_TEMPLATE = string.Template("Intégrale Academy : votre espace stagiaire est disponible : ${link}")
 
-    formation_type = formation_label(_session_get(s, "training_type", ""))
-    dstart = fr_date(_session_get(s, "date_start", ""))
-    dend = fr_date(_session_get(s, "date_end", ""))
-
-    html = mail_layout(f"""
+TEST_FR_NOTIFY_EMAIL_TEMPLATE = string.Template("""
       <h2 style="text-align:center">📝 Test de français obligatoire</h2>
 
-      <p>Bonjour <strong>{t.get("first_name","").strip() or "Madame, Monsieur"}</strong>,</p>
+      <p>Bonjour <strong>${first_name}</strong>,</p>
 
       <p>
         Je me permets de revenir vers vous concernant votre inscription en formation
-        <strong>{formation_type}</strong>, qui se déroulera du <strong>{dstart}</strong> au <strong>{dend}</strong>.
+        <strong>${formation_type}</strong>, qui se déroulera du <strong>${dstart}</strong> au <strong>${dend}</strong>.
       </p>
 
       <p>
@@ -1704,15 +2869,15 @@ def admin_test_fr_notify(session_id: str, trainee_id: str):
 
       <div style="background:#f3f4f6;border:1px solid #e5e7eb;border-radius:12px;padding:14px;margin:16px 0">
         <p style="margin:0 0 10px 0"><strong>🔗 Lien du test :</strong>
-          <a href="{link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">{link}</a>
+          <a href="${link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">${link}</a>
         </p>
 
         <p style="margin:0 0 10px 0"><strong>🔑 Code d’activation :</strong>
-          <span style="font-size:16px;letter-spacing:1px">{code}</span>
+          <span style="font-size:16px;letter-spacing:1px">${code}</span>
         </p>
 
         <p style="margin:0;color:#b91c1c;font-weight:bold">
-          ⚠️ Attention : le test doit être réalisé le <u>{fr_date(deadline)}</u>.
+          ⚠️ Attention : le test doit être réalisé le <u>${deadline_fr}</u>.
         </p>
       </div>
 
@@ -1724,68 +2889,28 @@ def admin_test_fr_notify(session_id: str, trainee_id: str):
       </p>
 
       <p style="text-align:center;margin-top:18px">
-        <a href="{link}"
+        <a href="${link}"
            style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
           👉 Accéder au test de français
         </a>
       </p>
     """)
-    deadline_fr = fr_date(deadline)
 
-    sms = (
-        f"Intégrale Academy 📝 Bonjour {t.get('first_name','')}, "
-        f"Vous devez réalsier le Test de français obligatoire pour votre formation {formation_type}. "
-        f"Lien : {link} | Code : {code} | À faire le {deadline_fr}. "
-        f"Besoin d’aide ? 04 22 47 07 68"
-    )
-
-    brevo_send_email(t.get("email",""), subject, html)
-    brevo_send_sms(t.get("phone",""), sms)
-
-    t["test_fr_status"] = "in_progress"
-    t["test_fr_code"] = code
-    t["test_fr_deadline"] = deadline
-    t["test_fr_last_notified_at"] = _now_iso()
-    t["updated_at"] = _now_iso()
-
-    s["trainees"] = trainees
-    save_data(data)
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-
-@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/test-fr/relance")
-@admin_login_required
-def admin_test_fr_relance(session_id: str, trainee_id: str):
-    code = (request.form.get("code") or "").strip()
-    deadline = (request.form.get("deadline") or "").strip()
-    if not code or not deadline:
-        return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-
-    data = load_data()
-    s = find_session(data, session_id)
-    if not s:
-        abort(404)
-
-    trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
-    if not t:
-        abort(404)
-
-    link = "https://testb1.lapreventionsecurite.org/Public/"
-    subject = "Relance – Test de français à réaliser"
-
-    formation_type = formation_label(_session_get(s, "training_type", ""))
-    dstart = fr_date(_session_get(s, "date_start", ""))
-    dend = fr_date(_session_get(s, "date_end", ""))
-    deadline_fr = fr_date(deadline)
+TEST_FR_NOTIFY_SMS_TEMPLATE = string.Template(
+    "Intégrale Academy 📝 Bonjour ${first_name}, "
+    "Vous devez réalsier le Test de français obligatoire pour votre formation ${formation_type}. "
+    "Lien : ${link} | Code : ${code} | À faire le ${deadline_fr}. "
+    "Besoin d’aide ? 04 22 47 07 68"
+)
 
-    html = mail_layout(f"""
+TEST_FR_RELANCE_EMAIL_TEMPLATE = string.Template("""
       <h2 style="text-align:center;color:#b91c1c">⏰ Relance – Test de français obligatoire</h2>
 
-      <p>Bonjour <strong>{t.get("first_name","").strip() or "Madame, Monsieur"}</strong>,</p>
+      <p>Bonjour <strong>${first_name}</strong>,</p>
 
       <p>
         Nous revenons vers vous concernant votre inscription en formation
-        <strong>{formation_type}</strong> (du <strong>{dstart}</strong> au <strong>{dend}</strong>).
+        <strong>${formation_type}</strong> (du <strong>${dstart}</strong> au <strong>${dend}</strong>).
       </p>
 
       <p>
@@ -1795,15 +2920,15 @@ def admin_test_fr_relance(session_id: str, trainee_id: str):
 
       <div style="background:#fef2f2;border:1px solid #fecaca;border-radius:12px;padding:14px;margin:16px 0">
         <p style="margin:0 0 10px 0"><strong>🔗 Lien du test :</strong>
-          <a href="{link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">{link}</a>
+          <a href="${link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">${link}</a>
         </p>
 
         <p style="margin:0 0 10px 0"><strong>🔑 Code d’activation :</strong>
-          <span style="font-size:16px;letter-spacing:1px">{code}</span>
+          <span style="font-size:16px;letter-spacing:1px">${code}</span>
         </p>
 
         <p style="margin:0;color:#b91c1c;font-weight:bold">
-          ⚠️ Date limite : <u>{deadline_fr}</u>
+          ⚠️ Date limite : <u>${deadline_fr}</u>
         </p>
       </div>
 
@@ -1818,73 +2943,195 @@ def admin_test_fr_relance(session_id: str, trainee_id: str):
       </p>
 
       <p style="text-align:center;margin-top:18px">
-        <a href="{link}"
+        <a href="${link}"
            style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
           👉 Accéder au test de français
         </a>
       </p>
     """)
 
-    sms = (
-        f"Intégrale Academy ⏰ Relance : Bonjour {t.get('first_name','')}, "
-        f"Vous n'avez pas encore réalisé votre Test de français obligatoire avant votre entrée en formation {formation_type}. "
-        f"Lien : {link} | Code : {code} | Date limite : {deadline_fr}. "
-        f"Besoin d’aide ? 04 22 47 07 68"
+TEST_FR_RELANCE_SMS_TEMPLATE = string.Template(
+    "Intégrale Academy ⏰ Relance : Bonjour ${first_name}, "
+    "Vous n'avez pas encore réalisé votre Test de français obligatoire avant votre entrée en formation ${formation_type}. "
+    "Lien : ${link} | Code : ${code} | Date limite : ${deadline_fr}. "
+    "Besoin d’aide ? 04 22 47 07 68"
+)
+
+
+@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/send-access")
+@admin_login_required
+def admin_send_access(session_id: str, trainee_id: str):
+    data = load_data()
+    s = find_session(data, session_id)
+    if not s:
+        abort(404)
+    trainees = _session_trainees_list(s)
+    t = find_trainee(s, trainee_id, trainees)
+    if not t:
+        abort(404)
+
+    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
+    subject = "Accès à votre espace stagiaire – Intégrale Academy"
+
+    html = mail_layout(SEND_ACCESS_EMAIL_TEMPLATE.substitute(
+        session_name=_h(_session_get(s, "name", "")),
+        link=link,
+    ))
+
+    sms = SEND_ACCESS_SMS_TEMPLATE.substitute(link=link)
+
+    notify_email_and_sms(t.get("email", ""), subject, html, t.get("phone", ""), sms)
+
+    t["access_sent_at"] = _now_iso()
+    s["trainees"] = trainees
+    save_data(data)
+    return trainee_action_done(session_id, trainee_id, access_sent_at=t["access_sent_at"])
+
+# =========================
+# Test de français — notify/relance
+# =========================
+@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/test-fr/notify")
+@admin_login_required
+def admin_test_fr_notify(session_id: str, trainee_id: str):
+    code = (request.form.get("code") or "").strip()
+    deadline = (request.form.get("deadline") or "").strip()
+    if not code or not deadline:
+        return trainee_action_done(session_id, trainee_id, error="missing_code_or_deadline")
+
+    data = load_data()
+    s = find_session(data, session_id)
+    if not s:
+        abort(404)
+    trainees = _session_trainees_list(s)
+    t = find_trainee(s, trainee_id, trainees)
+    if not t:
+        abort(404)
+
+    link = "https://testb1.lapreventionsecurite.org/Public/"
+    subject = "Test de français à réaliser – Intégrale Academy"
+
+    formation_type = formation_label(_session_get(s, "training_type", ""))
+    dstart = fr_date(_session_get(s, "date_start", ""))
+    dend = fr_date(_session_get(s, "date_end", ""))
+
+    deadline_fr = fr_date(deadline)
+
+    html = mail_layout(TEST_FR_NOTIFY_EMAIL_TEMPLATE.substitute(
+        first_name=_h(t.get("first_name", "").strip() or "Madame, Monsieur"),
+        formation_type=_h(formation_type),
+        dstart=_h(dstart),
+        dend=_h(dend),
+        link=link,
+        code=_h(code),
+        deadline_fr=_h(deadline_fr),
+    ))
+
+    sms = TEST_FR_NOTIFY_SMS_TEMPLATE.substitute(
+        first_name=t.get("first_name", ""),
+        formation_type=formation_type,
+        link=link,
+        code=code,
+        deadline_fr=deadline_fr,
     )
 
-    brevo_send_email(t.get("email", ""), subject, html)
-    brevo_send_sms(t.get("phone", ""), sms)
+    notify_email_and_sms(t.get("email", ""), subject, html, t.get("phone", ""), sms)
 
-    t["test_fr_status"] = "relance"
+    t["test_fr_status"] = "in_progress"
     t["test_fr_code"] = code
     t["test_fr_deadline"] = deadline
-    t["test_fr_last_relance_at"] = _now_iso()
+    t["test_fr_last_notified_at"] = _now_iso()
     t["updated_at"] = _now_iso()
 
     s["trainees"] = trainees
     save_data(data)
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
+    return trainee_action_done(
+        session_id, trainee_id,
+        test_fr_status=t["test_fr_status"],
+        test_fr_deadline=deadline,
+        test_fr_last_notified_at=t["test_fr_last_notified_at"],
+    )
 
-# =========================
-# Documents — notify / nonconform / relance / zip
-# =========================
-@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/docs/notify")
+@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/test-fr/relance")
 @admin_login_required
-def admin_docs_notify(session_id: str, trainee_id: str):
+def admin_test_fr_relance(session_id: str, trainee_id: str):
+    code = (request.form.get("code") or "").strip()
+    deadline = (request.form.get("deadline") or "").strip()
+    if not code or not deadline:
+        return trainee_action_done(session_id, trainee_id, error="missing_code_or_deadline")
+
     data = load_data()
     s = find_session(data, session_id)
     if not s:
         abort(404)
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
-    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
-    subject = "Envoi de documents – Action requise (Intégrale Academy)"
+    link = "https://testb1.lapreventionsecurite.org/Public/"
+    subject = "Relance – Test de français à réaliser"
 
     formation_type = formation_label(_session_get(s, "training_type", ""))
     dstart = fr_date(_session_get(s, "date_start", ""))
     dend = fr_date(_session_get(s, "date_end", ""))
+    deadline_fr = fr_date(deadline)
 
-    first_name = (t.get("first_name") or "").strip() or "Madame, Monsieur"
+    html = mail_layout(TEST_FR_RELANCE_EMAIL_TEMPLATE.substitute(
+        first_name=_h(t.get("first_name", "").strip() or "Madame, Monsieur"),
+        formation_type=_h(formation_type),
+        dstart=_h(dstart),
+        dend=_h(dend),
+        link=link,
+        code=_h(code),
+        deadline_fr=_h(deadline_fr),
+    ))
 
-    html = mail_layout(f"""
+    sms = TEST_FR_RELANCE_SMS_TEMPLATE.substitute(
+        first_name=t.get("first_name", ""),
+        formation_type=formation_type,
+        link=link,
+        code=code,
+        deadline_fr=deadline_fr,
+    )
+
+    notify_email_and_sms(t.get("email", ""), subject, html, t.get("phone", ""), sms)
+
+    t["test_fr_status"] = "relance"
+    t["test_fr_code"] = code
+    t["test_fr_deadline"] = deadline
+    t["test_fr_last_relance_at"] = _now_iso()
+    t["updated_at"] = _now_iso()
+
+    s["trainees"] = trainees
+    save_data(data)
+    return trainee_action_done(
+        session_id, trainee_id,
+        test_fr_status=t["test_fr_status"],
+        test_fr_deadline=deadline,
+        test_fr_last_relance_at=t["test_fr_last_relance_at"],
+    )
+
+# =========================
+# Documents — notify / nonconform / relance / zip
+# =========================
+# ✅ mails / SMS du dossier (envoi, non-conformité, relance) : squelettes construits une seule fois
+# (les champs saisis — prénom, commentaires, formation, dates — sont échappés avec _h avant substitution)
+DOCS_NOTIFY_EMAIL_TEMPLATE = string.Template("""
       <h2 style="text-align:center">📄 Envoi de documents – Dossier formation</h2>
 
-      <p>Bonjour <strong>{first_name}</strong>,</p>
+      <p>Bonjour <strong>${first_name}</strong>,</p>
 
       <p>
         Dans le cadre de votre inscription en formation
-        <strong>{formation_type}</strong> (du <strong>{dstart}</strong> au <strong>{dend}</strong>),
+        <strong>${formation_type}</strong> (du <strong>${dstart}</strong> au <strong>${dend}</strong>),
         nous vous invitons à compléter votre Dossier Formation via votre espace stagiaire.
       </p>
 
       <div style="background:#f3f4f6;border:1px solid #e5e7eb;border-radius:12px;padding:14px;margin:16px 0">
         <p style="margin:0 0 10px 0">
           <strong>📍 Accès à votre espace stagiaire :</strong><br>
-          <a href="{link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">{link}</a>
+          <a href="${link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">${link}</a>
         </p>
 
         <p style="margin:0;color:#b91c1c;font-weight:bold">
@@ -1903,57 +3150,24 @@ def admin_docs_notify(session_id: str, trainee_id: str):
       </p>
 
       <p style="text-align:center;margin-top:18px">
-        <a href="{link}"
+        <a href="${link}"
            style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
           👉 Accéder à mon espace stagiaire
         </a>
       </p>
     """)
 
-    sms = (
-        f"Intégrale Academy 📄 Bonjour {t.get('first_name','')}, "
-        f"Nous vous remercions de bien vouloir compléter votre Dossier Formation concernant votre formation {formation_type} "
-        f"({dstart} au {dend}) via votre espace : {link} "
-        f"Besoin d’aide ? 04 22 47 07 68"
-    )
-
-    brevo_send_email(t.get("email", ""), subject, html)
-    brevo_send_sms(t.get("phone", ""), sms)
-
-    t["docs_notified_at"] = _now_iso()
-    t["updated_at"] = _now_iso()
-
-    s["trainees"] = trainees
-    s.pop("stagiaires", None)
-    save_data(data)
-
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-    
-@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/docs/nonconform/notify")
-@admin_login_required
-def admin_docs_nonconform_notify(session_id: str, trainee_id: str):
-    data = load_data()
-    s = find_session(data, session_id)
-    if not s:
-        abort(404)
-
-    trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
-    if not t:
-        abort(404)
-
-    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
-    training_type = _session_get(s, "training_type", "")
-    ensure_documents_schema_for_trainee(t, training_type)
-
-    details = docs_summary_text(t)
-
-    subject = "Documents non conformes – Action requise (Intégrale Academy)"
+DOCS_NOTIFY_SMS_TEMPLATE = string.Template(
+    "Intégrale Academy 📄 Bonjour ${first_name}, "
+    "Nous vous remercions de bien vouloir compléter votre Dossier Formation concernant votre formation ${formation_type} "
+    "(${dstart} au ${dend}) via votre espace : ${link} "
+    "Besoin d’aide ? 04 22 47 07 68"
+)
 
-    html = mail_layout(f"""
+DOCS_NONCONFORM_EMAIL_TEMPLATE = string.Template("""
       <h2 style="text-align:center;color:#b91c1c">❌ Documents non conformes / à corriger</h2>
 
-      <p>Bonjour <strong>{(t.get("first_name") or "").strip() or "Madame, Monsieur"}</strong>,</p>
+      <p>Bonjour <strong>${first_name}</strong>,</p>
 
       <p>
         Certains documents déposés dans votre dossier ne sont pas conformes (ou doivent être corrigés).
@@ -1962,11 +3176,11 @@ def admin_docs_nonconform_notify(session_id: str, trainee_id: str):
 
       <div style="background:#fef2f2;border:1px solid #fecaca;border-radius:12px;padding:14px;margin:16px 0">
         <p style="margin:0 0 10px 0"><strong>📌 Détail de vos documents :</strong></p>
-        <pre style="white-space:pre-wrap;background:#fff;border:1px solid #fee2e2;padding:10px;border-radius:10px;margin:0">{details or "Aucun détail disponible."}</pre>
+        <pre style="white-space:pre-wrap;background:#fff;border:1px solid #fee2e2;padding:10px;border-radius:10px;margin:0">${details}</pre>
 
         <p style="margin:14px 0 0 0">
           <strong>📍 Déposer les documents corrigés :</strong><br>
-          <a href="{link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">{link}</a>
+          <a href="${link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">${link}</a>
         </p>
 
         <p style="margin:10px 0 0 0;color:#b91c1c;font-weight:bold">
@@ -1985,118 +3199,213 @@ def admin_docs_nonconform_notify(session_id: str, trainee_id: str):
       </p>
 
       <p style="text-align:center;margin-top:18px">
-        <a href="{link}"
+        <a href="${link}"
+           style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
+          👉 Accéder à mon espace stagiaire
+        </a>
+      </p>
+    """)
+
+DOCS_NONCONFORM_SMS_TEMPLATE = string.Template(
+    "Intégrale Academy ❌ Bonjour ${first_name}, "
+    "Certains documents déposés sont NON CONFORMES. Nous vous invitons à corriger votre dépôt. La liste détaillée des non conformités vous a été adressée par mail. "
+    "Merci de déposer les documents corrigés sur votre espace : ${link} "
+    "Aide : 04 22 47 07 68"
+)
+
+DOCS_RELANCE_EMAIL_TEMPLATE = string.Template("""
+      <h2 style="text-align:center;color:#b91c1c">⏰ Relance – Votre Dossier Formation est incomplet</h2>
+
+      <p>Bonjour <strong>${first_name}</strong>,</p>
+
+      <p>
+        Nous revenons vers vous concernant votre inscription en formation
+        <strong>${formation_type}</strong> (du <strong>${dstart}</strong> au <strong>${dend}</strong>).
+      </p>
+
+      <p>
+        À ce jour, votre dossier est INCOMPLET (éléments manquants et/ou à corriger).
+        Merci de déposer les éléments nécessaires dès que possible via votre espace stagiaire.
+      </p>
+
+      <div style="background:#fef2f2;border:1px solid #fecaca;border-radius:12px;padding:14px;margin:16px 0">
+        <p style="margin:0 0 10px 0"><strong>📌 Votre dossier détaillé :</strong></p>
+       <pre style="white-space:pre-wrap;background:#fff;border:1px solid #fee2e2;padding:10px;border-radius:10px;margin:0">${docs_details}</pre>
+
+    <p style="margin:14px 0 10px 0"><strong>🧾 Informations à compléter :</strong></p>
+    <pre style="white-space:pre-wrap;background:#fff;border:1px solid #fee2e2;padding:10px;border-radius:10px;margin:0">${infos_details}</pre>
+
+        <p style="margin:12px 0 0 0">
+          <strong>📍 Informations à compléter et Dépôt des documents :</strong><br>
+          <a href="${link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">${link}</a>
+        </p>
+
+        <p style="margin:10px 0 0 0;color:#b91c1c;font-weight:bold">
+          ⚠️ Nous vous remercions de bien vouloir compléter votre dossier dès que possible !
+        </p>
+      </div>
+
+      <p style="margin-top:22px">
+        Si vous avez la moindre difficulté, contactez-nous au <strong>04 22 47 07 68</strong>.
+      </p>
+
+      <p style="margin-top:22px">
+        Merci par avance,<br>
+        <strong>Clément VAILLANT</strong><br>
+        Directeur Intégrale Academy
+      </p>
+
+      <p style="text-align:center;margin-top:18px">
+        <a href="${link}"
            style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
           👉 Accéder à mon espace stagiaire
         </a>
       </p>
     """)
 
-    sms = (
-        f"Intégrale Academy ❌ Bonjour {t.get('first_name','')}, "
-        f"Certains documents déposés sont NON CONFORMES. Nous vous invitons à corriger votre dépôt. La liste détaillée des non conformités vous a été adressée par mail. "
-        f"Merci de déposer les documents corrigés sur votre espace : {link} "
-        f"Aide : 04 22 47 07 68"
+DOCS_RELANCE_SMS_TEMPLATE = string.Template(
+    "Intégrale Academy ⏰ Relance : Bonjour ${first_name}, "
+    "Nous revenons vers vous au sujet de votre formation ${formation_type}. A ce jour votre Dossier Formation est INCOMPLET. Votre formation approche, et pour un meilleur suivi de votre inscription, nous vous remercions de bien vouloir compléter votre dossier dès que possible. "
+    "(${dstart} au ${dend}). Vous pouvez compléter votre dossier en cliquant ici : ${link} "
+    "Besoin d’aide ? 04 22 47 07 68"
+)
+
+
+@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/docs/notify")
+@admin_login_required
+def admin_docs_notify(session_id: str, trainee_id: str):
+    data = load_data()
+    s = find_session(data, session_id)
+    if not s:
+        abort(404)
+
+    trainees = _session_trainees_list(s)
+    t = find_trainee(s, trainee_id, trainees)
+    if not t:
+        abort(404)
+
+    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
+    subject = "Envoi de documents – Action requise (Intégrale Academy)"
+
+    formation_type = formation_label(_session_get(s, "training_type", ""))
+    dstart = fr_date(_session_get(s, "date_start", ""))
+    dend = fr_date(_session_get(s, "date_end", ""))
+
+    first_name = (t.get("first_name") or "").strip() or "Madame, Monsieur"
+
+    html = mail_layout(DOCS_NOTIFY_EMAIL_TEMPLATE.substitute(
+        first_name=_h(first_name),
+        formation_type=_h(formation_type),
+        dstart=_h(dstart),
+        dend=_h(dend),
+        link=link,
+    ))
+
+    sms = DOCS_NOTIFY_SMS_TEMPLATE.substitute(
+        first_name=t.get("first_name", ""),
+        formation_type=formation_type,
+        dstart=dstart,
+        dend=dend,
+        link=link,
     )
 
-    brevo_send_email(t.get("email",""), subject, html)
-    brevo_send_sms(t.get("phone",""), sms)
+    notify_email_and_sms(t.get("email", ""), subject, html, t.get("phone", ""), sms)
 
-    t["docs_last_nonconform_notified_at"] = _now_iso()
+    t["docs_notified_at"] = _now_iso()
     t["updated_at"] = _now_iso()
+
     s["trainees"] = trainees
     s.pop("stagiaires", None)
     save_data(data)
 
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-
-@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/docs/relance")
+    return trainee_action_done(session_id, trainee_id, docs_notified_at=t["docs_notified_at"])
+    
+@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/docs/nonconform/notify")
 @admin_login_required
-def admin_docs_relance(session_id: str, trainee_id: str):
+def admin_docs_nonconform_notify(session_id: str, trainee_id: str):
     data = load_data()
     s = find_session(data, session_id)
     if not s:
         abort(404)
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
     link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
     training_type = _session_get(s, "training_type", "")
     ensure_documents_schema_for_trainee(t, training_type)
-    
-    docs_details = docs_summary_text(t)
-    infos_details = infos_missing_text(t)
 
-    formation_type = formation_label(_session_get(s, "training_type", ""))
-    dstart = fr_date(_session_get(s, "date_start", ""))
-    dend = fr_date(_session_get(s, "date_end", ""))
+    details = docs_summary_html(t)
 
-    first_name = (t.get("first_name") or "").strip() or "Madame, Monsieur"
+    subject = "Documents non conformes – Action requise (Intégrale Academy)"
 
-    subject = "Relance : Dossier Formation incomplet"
+    html = mail_layout(DOCS_NONCONFORM_EMAIL_TEMPLATE.substitute(
+        first_name=_h((t.get("first_name") or "").strip() or "Madame, Monsieur"),
+        details=details or "Aucun détail disponible.",
+        link=link,
+    ))
 
-    html = mail_layout(f"""
-      <h2 style="text-align:center;color:#b91c1c">⏰ Relance – Votre Dossier Formation est incomplet</h2>
+    sms = DOCS_NONCONFORM_SMS_TEMPLATE.substitute(first_name=t.get("first_name", ""), link=link)
 
-      <p>Bonjour <strong>{first_name}</strong>,</p>
+    notify_email_and_sms(t.get("email", ""), subject, html, t.get("phone", ""), sms)
 
-      <p>
-        Nous revenons vers vous concernant votre inscription en formation
-        <strong>{formation_type}</strong> (du <strong>{dstart}</strong> au <strong>{dend}</strong>).
-      </p>
+    t["docs_last_nonconform_notified_at"] = _now_iso()
+    t["updated_at"] = _now_iso()
+    s["trainees"] = trainees
+    s.pop("stagiaires", None)
+    save_data(data)
 
-      <p>
-        À ce jour, votre dossier est INCOMPLET (éléments manquants et/ou à corriger).
-        Merci de déposer les éléments nécessaires dès que possible via votre espace stagiaire.
-      </p>
+    return trainee_action_done(session_id, trainee_id, docs_last_nonconform_notified_at=t["docs_last_nonconform_notified_at"])
 
-      <div style="background:#fef2f2;border:1px solid #fecaca;border-radius:12px;padding:14px;margin:16px 0">
-        <p style="margin:0 0 10px 0"><strong>📌 Votre dossier détaillé :</strong></p>
-       <pre style="white-space:pre-wrap;background:#fff;border:1px solid #fee2e2;padding:10px;border-radius:10px;margin:0">{docs_details or "Aucun document en attente."}</pre>
+@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/docs/relance")
+@admin_login_required
+def admin_docs_relance(session_id: str, trainee_id: str):
+    data = load_data()
+    s = find_session(data, session_id)
+    if not s:
+        abort(404)
 
-    <p style="margin:14px 0 10px 0"><strong>🧾 Informations à compléter :</strong></p>
-    <pre style="white-space:pre-wrap;background:#fff;border:1px solid #fee2e2;padding:10px;border-radius:10px;margin:0">{infos_details or "Aucune information manquante."}</pre>
+    trainees = _session_trainees_list(s)
+    t = find_trainee(s, trainee_id, trainees)
+    if not t:
+        abort(404)
 
-        <p style="margin:12px 0 0 0">
-          <strong>📍 Informations à compléter et Dépôt des documents :</strong><br>
-          <a href="{link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">{link}</a>
-        </p>
+    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
+    training_type = _session_get(s, "training_type", "")
+    ensure_documents_schema_for_trainee(t, training_type)
+    
+    docs_details = docs_summary_html(t)
+    infos_details = infos_missing_text(t)
 
-        <p style="margin:10px 0 0 0;color:#b91c1c;font-weight:bold">
-          ⚠️ Nous vous remercions de bien vouloir compléter votre dossier dès que possible !
-        </p>
-      </div>
+    formation_type = formation_label(_session_get(s, "training_type", ""))
+    dstart = fr_date(_session_get(s, "date_start", ""))
+    dend = fr_date(_session_get(s, "date_end", ""))
 
-      <p style="margin-top:22px">
-        Si vous avez la moindre difficulté, contactez-nous au <strong>04 22 47 07 68</strong>.
-      </p>
+    first_name = (t.get("first_name") or "").strip() or "Madame, Monsieur"
 
-      <p style="margin-top:22px">
-        Merci par avance,<br>
-        <strong>Clément VAILLANT</strong><br>
-        Directeur Intégrale Academy
-      </p>
+    subject = "Relance : Dossier Formation incomplet"
 
-      <p style="text-align:center;margin-top:18px">
-        <a href="{link}"
-           style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;text-decoration:none;font-weight:bold">
-          👉 Accéder à mon espace stagiaire
-        </a>
-      </p>
-    """)
+    html = mail_layout(DOCS_RELANCE_EMAIL_TEMPLATE.substitute(
+        first_name=_h(first_name),
+        formation_type=_h(formation_type),
+        dstart=_h(dstart),
+        dend=_h(dend),
+        docs_details=docs_details or "Aucun document en attente.",
+        infos_details=_h(infos_details or "Aucune information manquante."),
+        link=link,
+    ))
 
-    sms = (
-        f"Intégrale Academy ⏰ Relance : Bonjour {t.get('first_name','')}, "
-        f"Nous revenons vers vous au sujet de votre formation {formation_type}. A ce jour votre Dossier Formation est INCOMPLET. Votre formation approche, et pour un meilleur suivi de votre inscription, nous vous remercions de bien vouloir compléter votre dossier dès que possible. "
-        f"({dstart} au {dend}). Vous pouvez compléter votre dossier en cliquant ici : {link} "
-        f"Besoin d’aide ? 04 22 47 07 68"
+    sms = DOCS_RELANCE_SMS_TEMPLATE.substitute(
+        first_name=t.get("first_name", ""),
+        formation_type=formation_type,
+        dstart=dstart,
+        dend=dend,
+        link=link,
     )
 
-    brevo_send_email(t.get("email", ""), subject, html)
-    brevo_send_sms(t.get("phone", ""), sms)
+    notify_email_and_sms(t.get("email", ""), subject, html, t.get("phone", ""), sms)
 
     t["docs_last_relance_at"] = _now_iso()
     t["updated_at"] = _now_iso()
@@ -2105,7 +3414,7 @@ def admin_docs_relance(session_id: str, trainee_id: str):
     s.pop("stagiaires", None)
     save_data(data)
 
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
+    return trainee_action_done(session_id, trainee_id, docs_last_relance_at=t["docs_last_relance_at"])
 
 @app.get("/admin/sessions/<session_id>/stagiaires/<trainee_id>/documents.zip")
 @admin_login_required
@@ -2116,52 +3425,177 @@ def admin_docs_zip(session_id: str, trainee_id: str):
         abort(404)
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
     docs = t.get("documents") or []
-    buf = BytesIO()
+    prenom = (t.get("first_name") or "").strip()
+    nom = (t.get("last_name") or "").strip()
+    entries: List[Tuple[str, str, float]] = []
+    listings: Dict[str, Dict[str, os.DirEntry]] = {}
 
-    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for d in docs:
-            tokens = []
+    for d in docs:
+        tokens = []
 
-            # ✅ multi-fichiers en priorité
-            if isinstance(d.get("files"), list) and d["files"]:
-                tokens = [x for x in d["files"] if x]
-            else:
-                # compat: 1 fichier
-                tok = (d.get("file") or "")
-                if tok:
-                    tokens = [tok]
+        # ✅ multi-fichiers en priorité
+        if isinstance(d.get("files"), list) and d["files"]:
+            tokens = [x for x in d["files"] if x]
+        else:
+            # compat: 1 fichier
+            tok = (d.get("file") or "")
+            if tok:
+                tokens = [tok]
 
-            if not tokens:
-                continue
+        if not tokens:
+            continue
 
-            label = (d.get("label") or "document").replace("/", "-")
-            prenom = (t.get("first_name") or "").strip()
-            nom = (t.get("last_name") or "").strip()
+        label = (d.get("label") or "document").replace("/", "-")
 
-            for i, token in enumerate(tokens, start=1):
-                fp = _detokenize_path(token)
-                if not os.path.exists(fp):
-                    continue
+        for i, token in enumerate(tokens, start=1):
+            fp = _detokenize_path(token)
+            folder, name = os.path.split(fp)
+            entry = _dir_listing(listings, folder).get(name)
+            if entry is None:
+                continue
 
-                ext = os.path.splitext(fp)[1] or ""
-                base = f"{label} {prenom} {nom}".strip().replace("  ", " ")
+            stem, dot, suffix = name.rpartition(".")
+            ext = (dot + suffix) if stem else ""
+            base = f"{label} {prenom} {nom}".strip().replace("  ", " ")
 
-                # ✅ si plusieurs fichiers: suffixe _1, _2...
-                arc = (base + ext) if len(tokens) == 1 else (f"{base}_{i}{ext}")
-                z.write(fp, arcname=arc)
+            # ✅ si plusieurs fichiers: suffixe _1, _2...
+            arc = (base + ext) if len(tokens) == 1 else (f"{base}_{i}{ext}")
+            entries.append((fp, arc, entry.stat().st_mtime))
 
-    buf.seek(0)
     zipname = f"Documents_{t.get('first_name','')}_{t.get('last_name','')}.zip".replace(" ", "_")
-    return send_file(buf, as_attachment=True, download_name=zipname, mimetype="application/zip")
+    resp = app.response_class(stream_with_context(_stream_zip(entries)), mimetype="application/zip")
+    resp.headers.set("Content-Disposition", "attachment", filename=zipname)
+    return resp
+
+
+ZIP_STREAM_CHUNK = 64 * 1024
+
+
+def _dir_listing(listings: Dict[str, Dict[str, os.DirEntry]], folder: str) -> Dict[str, os.DirEntry]:
+    """Un seul scandir par dossier (au lieu d'un stat par document) ; {nom: DirEntry} des fichiers."""
+    if folder not in listings:
+        try:
+            with os.scandir(folder) as it:
+                listings[folder] = {e.name: e for e in it if e.is_file()}
+        except OSError:
+            listings[folder] = {}
+    return listings[folder]
+
+# ✅ formats déjà compressés : recompresser coûte du CPU pour ~0 % de gain
+_ZIP_STORED_EXT = frozenset({
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".pdf", ".zip", ".docx", ".xlsx", ".mp4", ".mov",
+})
+
+
+# ✅ DEFLATE niveau 1 : ~3x plus rapide que le niveau 6 par défaut, archive à peine plus grosse
+ZIP_DEFLATE_LEVEL = 1
+
+
+def _zip_compress_type(path: str) -> int:
+    ext = os.path.splitext(path)[1].lower()
+    return zipfile.ZIP_STORED if ext in _ZIP_STORED_EXT else zipfile.ZIP_DEFLATED
+
+
+def _zip_entry_info(fp: str, arc: str, mtime: float) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(arc, date_time=time.localtime(mtime)[:6])
+    info.external_attr = 0o644 << 16
+    info.compress_type = _zip_compress_type(fp)
+    return info
+
+
+class _ZipSink:
+    """Fichier en écriture seule (non seekable) : zipfile y écrit, le générateur vide les morceaux."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks.clear()
+        return out
+
+
+# ✅ lecture anticipée : les fichiers suivants sont lus en parallèle pendant que le courant est compressé/envoyé
+ZIP_READ_AHEAD = 4
+ZIP_READ_AHEAD_MAX_BYTES = 16 * 1024 * 1024  # au-delà : lu au fil de l'eau (mémoire bornée)
+_ZIP_READ_POOL = ThreadPoolExecutor(max_workers=ZIP_READ_AHEAD, thread_name_prefix="zip-read")
+
+
+def _read_for_zip(fp: str) -> Optional[bytes]:
+    """Contenu du fichier, ou None s'il est trop gros pour être gardé en mémoire."""
+    with open(fp, "rb") as src:
+        if os.fstat(src.fileno()).st_size > ZIP_READ_AHEAD_MAX_BYTES:
+            return None
+        return src.read()
+
+
+def _stream_zip(entries: List[Tuple[str, str, float]]):
+    """
+    Produit le zip au fil de l'eau (mémoire bornée, premier octet envoyé tout de suite).
+    entries: [(chemin disque, nom dans l'archive, mtime)]
+    """
+    sink = _ZipSink()
+    todo = iter(entries)
+    pending: deque = deque()
+
+    def read_next() -> None:
+        for entry in todo:
+            pending.append((entry, _ZIP_READ_POOL.submit(_read_for_zip, entry[0])))
+            return
+
+    for _ in range(ZIP_READ_AHEAD):
+        read_next()
+
+    try:
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=ZIP_DEFLATE_LEVEL) as z:
+            while pending:
+                (fp, arc, mtime), fut = pending.popleft()
+                read_next()
+                info = _zip_entry_info(fp, arc, mtime)
+                # ✅ fichier illisible / supprimé : ignoré AVANT d'ouvrir l'entrée (jamais de membre tronqué)
+                try:
+                    blob = fut.result()
+                    src = open(fp, "rb") if blob is None else None
+                except OSError:
+                    continue
+                if src is None:
+                    # writestr : niveau DEFLATE passé par l'API publique
+                    z.writestr(info, blob, compresslevel=ZIP_DEFLATE_LEVEL)
+                else:
+                    # gros fichier lu au fil de l'eau : ZipFile.open(info) n'accepte pas de niveau,
+                    # il garde le niveau zlib par défaut (le plus souvent PDF / images : stockés tels quels)
+                    with src, z.open(info, "w") as dst:
+                        while True:
+                            chunk = src.read(ZIP_STREAM_CHUNK)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                            if sink.chunks:
+                                yield sink.drain()
+                yield sink.drain()
+        yield sink.drain()
+    finally:
+        # téléchargement interrompu : on abandonne les lectures pas encore commencées
+        for _, fut in pending:
+            fut.cancel()
 
 # =========================
 # API docs autosave (status/comment)
 # =========================
+# ⚠️ conservé pour compatibilité : voir /batch-update
 @app.post("/api/sessions/<session_id>/stagiaires/<trainee_id>/documents/update")
 @admin_login_required
 def api_docs_update(session_id: str, trainee_id: str):
@@ -2171,29 +3605,33 @@ def api_docs_update(session_id: str, trainee_id: str):
         return jsonify({"ok": False, "error": "session_not_found"}), 404
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         return jsonify({"ok": False, "error": "trainee_not_found"}), 404
 
-    payload = request.get_json(silent=True) or {}
+    payload = request_json()
     doc_key = payload.get("key")
     field = payload.get("field")
     value = payload.get("value")
 
     if field not in ("status", "comment"):
         return jsonify({"ok": False, "error": "invalid_field"}), 400
+    if field == "status":
+        value = canonical_doc_status(value)
 
-    docs = t.get("documents") or []
-    for d in docs:
-        if d.get("key") == doc_key:
-            d[field] = value
-            break
+    status_changed = False
+    d = docs_by_key(t).get(doc_key)
+    if d is not None:
+        status_changed = field == "status" and d.get("status") != value
+        d[field] = value
 
     t["updated_at"] = _now_iso()
 
     # ✅ Synchronisation automatique du statut dossier
-    training_type = _session_get(s, "training_type", "")
-    t["dossier_status"] = "complete" if dossier_is_complete_total(t, training_type) else "incomplete"
+    # (un commentaire ne change pas la complétude : pas de re-parcours des documents à chaque autosave)
+    if status_changed or t.get("dossier_status") not in ("complete", "incomplete"):
+        training_type = _session_get(s, "training_type", "")
+        t["dossier_status"] = "complete" if dossier_is_complete_total(t, training_type) else "incomplete"
 
     # ✅ PERSISTENCE (sinon ça se perd au refresh)
     s["trainees"] = trainees
@@ -2202,7 +3640,7 @@ def api_docs_update(session_id: str, trainee_id: str):
 
     return jsonify({
         "ok": True,
-        "dossier_is_complete": dossier_is_complete_total(t, training_type),
+        "dossier_is_complete": t["dossier_status"] == "complete",
         "dossier_status": t["dossier_status"]
     })
 
@@ -2232,61 +3670,14 @@ def deliverables_progress(t: Dict[str, Any]):
     return done, total, (done == total)
 
 
-@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/deliverables/<kind>/upload")
-@admin_login_required
-def admin_upload_deliverable(session_id: str, trainee_id: str, kind: str):
-    if kind not in DELIVERABLE_LABELS:
-        abort(404)
-
-    data = load_data()
-    s = find_session(data, session_id)
-    if not s:
-        abort(404)
-
-    trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
-    if not t:
-        abort(404)
-
-    f = request.files.get("file")
-    if not f or not f.filename:
-        return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-
-    try:
-        stored = _store_file(session_id, trainee_id, "deliverables", f)
-    except Exception:
-        return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
-
-    token = _tokenize_path(stored)
-
-    t.setdefault("deliverables", {})
-    t["deliverables"][kind] = token
-    t["updated_at"] = _now_iso()
-
-    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
-    label = DELIVERABLE_LABELS[kind]
-
-    # =========================
-    # ✅ Jolis mails + SMS
-    # =========================
-    first_name = (t.get("first_name") or "").strip() or "Madame, Monsieur"
-    formation_type = formation_label(_session_get(s, "training_type", ""))
-    dstart = fr_date(_session_get(s, "date_start", ""))
-    dend = fr_date(_session_get(s, "date_end", ""))
-
-    # ✅ type formation brut pour la logique CNAPS
-    tt_raw = (_session_get(s, "training_type", "") or "").strip()
-    tt = tt_raw.upper()
-
-    extra_line = ""
-    cnaps_block = ""
-
-    if kind == "diplome":
-        extra_line = "🎉 Félicitations ! Votre diplôme est maintenant disponible."
+# ✅ mail / SMS « document de fin de formation disponible » : parties fixes construites une seule fois
+DELIVERABLE_EXTRA_LINES = {
+    "diplome": "🎉 Félicitations ! Votre diplôme est maintenant disponible.",
+    "attestation_fin_formation": "📄 Votre attestation de fin de formation est disponible et peut être téléchargée à tout moment.",
+    "carte_sst": "🩺 Votre carte SST est disponible. Conservez-la précieusement, elle peut être demandée par un employeur.",
+}
 
-        # --- CNAPS (différent selon formation) ---
-        if tt == "APS":
-            cnaps_block = f"""
+DELIVERABLE_CNAPS_BLOCK_APS = """
             <div style="background:#fff7ed;border:1px solid #fed7aa;border-radius:12px;padding:14px;margin:16px 0">
               <p style="margin:0 0 8px 0;font-weight:900;color:#9a3412">🛡️ Carte professionnelle – Information importante</p>
               <p style="margin:0;color:#7c2d12;line-height:1.55">
@@ -2298,8 +3689,8 @@ def admin_upload_deliverable(session_id: str, trainee_id: str, kind: str):
               </p>
             </div>
             """
-        elif tt == "A3P":
-            cnaps_block = f"""
+
+DELIVERABLE_CNAPS_BLOCK_A3P = """
             <div style="background:#eff6ff;border:1px solid #bfdbfe;border-radius:12px;padding:14px;margin:16px 0">
               <p style="margin:0 0 8px 0;font-weight:900;color:#1d4ed8">🛡️ Demande de carte professionnelle (CNAPS)</p>
               <p style="margin:0;color:#1e3a8a;line-height:1.55">
@@ -2322,8 +3713,8 @@ def admin_upload_deliverable(session_id: str, trainee_id: str, kind: str):
               </p>
             </div>
             """
-        elif "DIRIGEANT" in tt:
-            cnaps_block = f"""
+
+DELIVERABLE_CNAPS_BLOCK_DIRIGEANT = """
             <div style="background:#f0fdf4;border:1px solid #bbf7d0;border-radius:12px;padding:14px;margin:16px 0">
               <p style="margin:0 0 8px 0;font-weight:900;color:#166534">🏛️ Agrément dirigeant (CNAPS)</p>
               <p style="margin:0;color:#14532d;line-height:1.55">
@@ -2340,15 +3731,7 @@ def admin_upload_deliverable(session_id: str, trainee_id: str, kind: str):
             </div>
             """
 
-    elif kind == "attestation_fin_formation":
-        extra_line = "📄 Votre attestation de fin de formation est disponible et peut être téléchargée à tout moment."
-    elif kind == "carte_sst":
-        extra_line = "🩺 Votre carte SST est disponible. Conservez-la précieusement, elle peut être demandée par un employeur."
-
-    subject = f"{label} disponible – Intégrale Academy"
-
-    # ✅ Bloc avis Google (tous les cas)
-    google_block = """
+DELIVERABLE_GOOGLE_BLOCK = """
       <div style="background:#fff;border:1px solid #e5e7eb;border-radius:12px;padding:14px;margin:16px 0">
         <p style="margin:0 0 8px 0;font-weight:900">⭐ Un petit service (1 minute)</p>
         <p style="margin:0;color:#374151;line-height:1.55">
@@ -2364,41 +3747,41 @@ def admin_upload_deliverable(session_id: str, trainee_id: str, kind: str):
       </div>
     """
 
-    html = mail_layout(f"""
-      <h2 style="text-align:center">✅ {label} disponible</h2>
+DELIVERABLE_EMAIL_TEMPLATE = string.Template("""
+      <h2 style="text-align:center">✅ ${label} disponible</h2>
 
-      <p>Bonjour <strong>{first_name}</strong>,</p>
+      <p>Bonjour <strong>${first_name}</strong>,</p>
 
       <p>
-        Nous avons le plaisir de vous informer que votre <strong>{label}</strong>
+        Nous avons le plaisir de vous informer que votre <strong>${label}</strong>
         est désormais disponible dans votre espace stagiaire.
       </p>
 
-      {"<p style='margin-top:10px;font-weight:700'>" + extra_line + "</p>" if extra_line else ""}
+      ${extra_html}
 
-      {cnaps_block}
+      ${cnaps_block}
 
       <div style="background:#f3f4f6;border:1px solid #e5e7eb;border-radius:12px;padding:14px;margin:16px 0">
         <p style="margin:0 0 10px 0">
-          <strong>📌 Formation :</strong> {formation_type}
-          {" — <strong>Dates :</strong> " + dstart + " au " + dend if (dstart or dend) else ""}
+          <strong>📌 Formation :</strong> ${formation_type}
+          ${dates_html}
         </p>
 
         <p style="margin:0">
           <strong>📍 Accéder à votre espace stagiaire :</strong><br>
-          <a href="{link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">{link}</a>
+          <a href="${link}" style="color:#1f8f4a;text-decoration:none;font-weight:bold">${link}</a>
         </p>
       </div>
 
       <p style="text-align:center;margin-top:18px">
-        <a href="{link}"
+        <a href="${link}"
            style="display:inline-block;background:#1f8f4a;color:white;padding:12px 18px;border-radius:10px;
                   text-decoration:none;font-weight:bold">
           👉 Accéder à mon espace stagiaire
         </a>
       </p>
 
-      {google_block}
+      ${google_block}
 
       <p style="margin-top:22px">
         Pour toute question, vous pouvez nous contacter au <strong>04 22 47 07 68</strong>.
@@ -2422,38 +3805,135 @@ def admin_upload_deliverable(session_id: str, trainee_id: str, kind: str):
       </p>
     """)
 
+DELIVERABLE_SMS_TEMPLATE = string.Template(
+    "Intégrale Academy ✅ ${name_prefix}"
+    "votre ${label} est disponible sur votre espace : ${link} "
+    "(Aide : 04 22 47 07 68)"
+)
+
+
+@app.post("/admin/sessions/<session_id>/stagiaires/<trainee_id>/deliverables/<kind>/upload")
+@admin_login_required
+def admin_upload_deliverable(session_id: str, trainee_id: str, kind: str):
+    if kind not in DELIVERABLE_LABELS:
+        abort(404)
+
+    data = load_data()
+    s = find_session(data, session_id)
+    if not s:
+        abort(404)
+
+    trainees = _session_trainees_list(s)
+    t = find_trainee(s, trainee_id, trainees)
+    if not t:
+        abort(404)
+
+    f = request.files.get("file")
+    if not f or not f.filename:
+        return trainee_action_done(session_id, trainee_id, error="missing_file")
+
+    try:
+        stored = _store_file(session_id, trainee_id, "deliverables", f)
+    except Exception:
+        return trainee_action_done(session_id, trainee_id, error="store_failed")
+
+    token = _tokenize_path(stored)
+
+    t.setdefault("deliverables", {})
+    t["deliverables"][kind] = token
+    t["updated_at"] = _now_iso()
+
+    link = f"{PUBLIC_STUDENT_PORTAL_BASE.rstrip('/')}/espace/{t.get('public_token','')}"
+    label = DELIVERABLE_LABELS[kind]
+
+    # =========================
+    # ✅ Jolis mails + SMS
+    # =========================
+    first_name = (t.get("first_name") or "").strip() or "Madame, Monsieur"
+    formation_type = formation_label(_session_get(s, "training_type", ""))
+    dstart = fr_date(_session_get(s, "date_start", ""))
+    dend = fr_date(_session_get(s, "date_end", ""))
+
+    # ✅ type formation brut pour la logique CNAPS
+    tt_raw = (_session_get(s, "training_type", "") or "").strip()
+    tt = tt_raw.upper()
+
+    extra_line = DELIVERABLE_EXTRA_LINES.get(kind, "")
+    cnaps_block = ""
+    if kind == "diplome":
+        # --- CNAPS (différent selon formation) ---
+        if tt == "APS":
+            cnaps_block = DELIVERABLE_CNAPS_BLOCK_APS
+        elif tt == "A3P":
+            cnaps_block = DELIVERABLE_CNAPS_BLOCK_A3P
+        elif "DIRIGEANT" in tt:
+            cnaps_block = DELIVERABLE_CNAPS_BLOCK_DIRIGEANT
+
+    subject = f"{label} disponible – Intégrale Academy"
+
+    html = mail_layout(DELIVERABLE_EMAIL_TEMPLATE.substitute(
+        label=label,
+        first_name=_h(first_name),
+        extra_html=("<p style='margin-top:10px;font-weight:700'>" + extra_line + "</p>") if extra_line else "",
+        cnaps_block=cnaps_block,
+        formation_type=_h(formation_type),
+        dates_html=(" — <strong>Dates :</strong> " + _h(dstart) + " au " + _h(dend)) if (dstart or dend) else "",
+        link=link,
+        google_block=DELIVERABLE_GOOGLE_BLOCK,
+    ))
+
     sms_name = (t.get("first_name") or "").strip()
-    sms = (
-        f"Intégrale Academy ✅ {sms_name + ', ' if sms_name else ''}"
-        f"votre {label} est disponible sur votre espace : {link} "
-        f"(Aide : 04 22 47 07 68)"
+    sms = DELIVERABLE_SMS_TEMPLATE.substitute(
+        name_prefix=(sms_name + ", ") if sms_name else "",
+        label=label,
+        link=link,
     )
 
-    brevo_send_email(t.get("email", ""), subject, html)
-    brevo_send_sms(t.get("phone", ""), sms)
+    notify_email_and_sms(t.get("email", ""), subject, html, t.get("phone", ""), sms)
 
     # ✅ persistance
     s["trainees"] = trainees
     s.pop("stagiaires", None)
     save_data(data)
 
-    return redirect(url_for("admin_trainee_page", session_id=session_id, trainee_id=trainee_id))
+    # ✅ lien du fichier importé : la ligne du tableau passe à "Importé" sans recharger la fiche
+    return trainee_action_done(
+        session_id, trainee_id,
+        **{f"deliverable_{kind}": url_for("admin_view_upload", path=token)},
+    )
+
+# ✅ index public_token -> (session, stagiaire), reconstruit seulement après une modification
+_TOKEN_IDX: Dict[str, Any] = {"data": None, "version": -1, "by_token": {}}
+
+
+def _token_index(data: Dict[str, Any]) -> Dict[str, Any]:
+    with _LOCK:
+        if _TOKEN_IDX["data"] is not data or _TOKEN_IDX["version"] != _DATA_VERSION:
+            by_token = {}
+            for s in data.get("sessions", []) or []:
+                for t in (s.get("trainees") or s.get("stagiaires") or []):
+                    tok = (t.get("public_token") or "").strip()
+                    if tok:
+                        by_token.setdefault(tok, (s, t))
+            _TOKEN_IDX["data"] = data
+            _TOKEN_IDX["version"] = _DATA_VERSION
+            _TOKEN_IDX["by_token"] = by_token
+        return _TOKEN_IDX["by_token"]
+
 
 def find_session_and_trainee_by_token(data: Dict[str, Any], token: str):
     token = (token or "").strip()
     if not token:
         return None, None
 
-    sessions = data.get("sessions", []) or []
-    for s in sessions:
-        trainees = s.get("trainees") or s.get("stagiaires") or []
-        for t in trainees:
-            if (t.get("public_token") or "").strip() == token:
-                return s, t
+    hit = _token_index(data).get(token)
+    if hit and (hit[1].get("public_token") or "").strip() == token:
+        return hit
     return None, None
 
 
 @app.get("/espace/<token>")
+@etag_by_data_version
 def public_trainee_space(token):
     data = load_data()
     s, t = find_session_and_trainee_by_token(data, token)
@@ -2463,24 +3943,21 @@ def public_trainee_space(token):
 
     training_type = _session_get(s, "training_type", "")
 
-    # ✅ aligne la liste des docs requis
-    ensure_documents_schema_for_trainee(t, training_type)
+    # ✅ aligne la liste des docs requis (persisté seulement si le schéma a bougé)
+    if ensure_documents_schema_for_trainee(t, training_type):
+        save_data(data)
 
-    for d in (t.get("documents") or []):
-        d["file_token"] = d.get("file") or ""
+    trainee_view = dict(t, documents=[
+        dict(d, file_token=d.get("file") or "") for d in (t.get("documents") or [])
+    ])
 
     show_hosting = ((training_type or "").strip().upper() == "A3P")
     show_vae = ("VAE" in (training_type or "").upper())
 
-    # ✅ persistance
-    s["trainees"] = _session_trainees_list(s)
-    s.pop("stagiaires", None)
-    save_data(data)
-
     return render_template(
         "public_trainee.html",
         session=s,
-        trainee=t,
+        trainee=trainee_view,
         token=token,
         show_hosting=show_hosting,
         show_vae=show_vae,
@@ -2497,7 +3974,7 @@ def admin_upload_identity_photo(session_id: str, trainee_id: str):
         abort(404)
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
@@ -2535,7 +4012,7 @@ def public_infos_update(token: str):
     if not s or not t:
         return jsonify({"ok": False}), 404
 
-    payload = request.get_json(silent=True) or {}
+    payload = request_json()
 
     # champs autorisés (sécurité)
     allowed = {
@@ -2608,8 +4085,7 @@ def public_doc_upload(token: str, doc_key: str):
     original_name = secure_filename(f.filename or "document")
 
     # ✅ retrouver la config du doc (accept)
-    docs = t.get("documents") or []
-    target = next((d for d in docs if d.get("key") == doc_key), None)
+    target = docs_by_key(t).get(doc_key)
     if not target:
         return redirect(url_for("public_trainee_space", token=token))
 
@@ -2630,33 +4106,30 @@ def public_doc_upload(token: str, doc_key: str):
     # ✅ stockage du fichier
     session_id = s.get("id")
     trainee_id = t.get("id")
-    stored = _store_file(session_id, trainee_id, "public_documents", f)
+    try:
+        stored = _store_file(session_id, trainee_id, "public_documents", f)
+    except ValueError:
+        return redirect(url_for("public_trainee_space", token=token))
     new_token = _tokenize_path(stored)
 
     # ✅ MAJ du doc: on APPEND dans files (sans écraser)
-    for d in docs:
-        if d.get("key") == doc_key:
-            cur_files = d.get("files")
-            if not isinstance(cur_files, list):
-                cur_files = []
-
-            # compat: si un ancien "file" existe mais pas dans files, on le garde
-            old = (d.get("file") or "").strip()
-            if old and old not in cur_files:
-                cur_files.append(old)
-
-            cur_files.append(new_token)
-
-            # on garde le premier fichier dans "file" (pour compat template/admin)
-            d["files"] = cur_files
-            d["file"] = cur_files[0] if cur_files else ""
-
-            cur = (d.get("status") or "").strip().upper()
-            if cur in ("", "NON DÉPOSÉ", "NON DEPOSE", "NON_DEPOSE"):
-                d["status"] = "A CONTRÔLER"
-            if d.get("status") == "A CONTROLER":
-                d["status"] = "A CONTRÔLER"
-            break
+    cur_files = target.get("files")
+    if not isinstance(cur_files, list):
+        cur_files = []
+
+    # compat: si un ancien "file" existe mais pas dans files, on le garde
+    old = (target.get("file") or "").strip()
+    if old and old not in cur_files:
+        cur_files.append(old)
+
+    cur_files.append(new_token)
+
+    # on garde le premier fichier dans "file" (pour compat template/admin)
+    target["files"] = cur_files
+    target["file"] = cur_files[0] if cur_files else ""
+
+    cur = canonical_doc_status(target.get("status"))
+    target["status"] = DOC_STATUS_A_CONTROLER if cur == DOC_STATUS_NON_DEPOSE else cur
 
     t["updated_at"] = _now_iso()
     t["dossier_status"] = "complete" if dossier_is_complete_total(t, training_type) else "incomplete"
@@ -2682,6 +4155,7 @@ def public_doc_upload(token: str, doc_key: str):
 # =========================
 @app.get("/admin/sessions/<session_id>/stagiaires/<trainee_id>")
 @admin_login_required
+@etag_by_data_version
 def admin_trainee_page(session_id: str, trainee_id: str):
     data = load_data()
     s = find_session(data, session_id)
@@ -2698,30 +4172,32 @@ def admin_trainee_page(session_id: str, trainee_id: str):
     }
 
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     if not t:
         abort(404)
 
     training_type = session_view["training_type"]
 
     # ✅ IMPORTANT : on impose la liste de documents selon la formation (et supprime dom)
-    ensure_documents_schema_for_trainee(t, training_type)
+    changed = ensure_documents_schema_for_trainee(t, training_type)
+    changed = "stagiaires" in s or changed
 
     # ✅ deliverables
-    t.setdefault("deliverables", {})
+    if not isinstance(t.get("deliverables"), dict):
+        t["deliverables"] = {}
+        changed = True
 
-    # file tokens for template links (documents)
+    # file tokens for template links (documents) : sur des copies d'affichage
+    docs_view = []
     for d in (t.get("documents") or []):
-        # compat: 1 fichier
-        token = d.get("file") or ""
-        d["file_token"] = token
-    
-        # ✅ multi-fichiers
         files = d.get("files")
-        if isinstance(files, list) and files:
-            d["file_tokens"] = [x for x in files if x]
-        else:
-            d["file_tokens"] = []
+        docs_view.append(dict(
+            d,
+            # compat: 1 fichier
+            file_token=d.get("file") or "",
+            # ✅ multi-fichiers
+            file_tokens=[x for x in files if x] if isinstance(files, list) else [],
+        ))
 
     # deliverables view
     deliverables_view = []
@@ -2748,22 +4224,28 @@ def admin_trainee_page(session_id: str, trainee_id: str):
     ]
 
     # ✅ s'assure que no_permis est bien un bool
-    t["no_permis"] = bool(t.get("no_permis"))
+    if not isinstance(t.get("no_permis"), bool):
+        t["no_permis"] = bool(t.get("no_permis"))
+        changed = True
 
     # ✅ dossier_status cohérent avec les docs requis
     dossier_complete = dossier_is_complete_total(t, training_type)
-    t["dossier_status"] = "complete" if dossier_complete else "incomplete"
-    t["updated_at"] = _now_iso()
+    dossier_status = "complete" if dossier_complete else "incomplete"
+    if t.get("dossier_status") != dossier_status:
+        t["dossier_status"] = dossier_status
+        t["updated_at"] = _now_iso()
+        changed = True
 
-    # ✅ persistance
-    s["trainees"] = trainees
-    s.pop("stagiaires", None)
-    save_data(data)
+    # ✅ persistance : seulement si une valeur stockée a changé (simple consultation = pas d'écriture)
+    if changed:
+        s["trainees"] = trainees
+        s.pop("stagiaires", None)
+        save_data(data)
 
     return render_template(
         "admin_trainee.html",
         session=session_view,
-        trainee=t,
+        trainee=dict(t, documents=docs_view),
         show_vae=show_vae,
         vae_steps=vae_steps,
         dossier_is_complete=dossier_complete,
@@ -2789,11 +4271,7 @@ def api_docs_to_control():
             ensure_documents_schema_for_trainee(t, training_type)
 
             docs = t.get("documents") or []
-            pending = 0
-            for d in docs:
-                st = (d.get("status") or "").strip().upper()
-                if st in ("A CONTRÔLER", "A CONTROLER"):
-                    pending += 1
+            pending = sum(1 for d in docs if d.get("status") == DOC_STATUS_A_CONTROLER)
 
             if pending > 0:
                 out.append({
@@ -2831,11 +4309,7 @@ def public_docs_to_control():
             ensure_documents_schema_for_trainee(t, training_type)
 
             docs = t.get("documents") or []
-            pending = 0
-            for d in docs:
-                st = (d.get("status") or "").strip().upper()
-                if st in ("A CONTRÔLER", "A CONTROLER"):
-                    pending += 1
+            pending = sum(1 for d in docs if d.get("status") == DOC_STATUS_A_CONTROLER)
 
             if pending > 0:
                 out.append({
@@ -2906,6 +4380,7 @@ def api_trainees_search():
 
 @app.get("/admin/sessions/archived")
 @admin_login_required
+@etag_by_data_version
 def admin_sessions_archived():
     data = load_data()
     out_sessions = []
@@ -2914,7 +4389,7 @@ def admin_sessions_archived():
         if not bool(s.get("archived")):
             continue
 
-        st = compute_stats(s)
+        st = session_summary(s)
         out_sessions.append({
             "id": s.get("id"),
             "name": _session_get(s, "name", ""),
@@ -2929,7 +4404,6 @@ def admin_sessions_archived():
     return render_template(
         "admin_sessions_archived.html",
         sessions=out_sessions,
-        formation_types=FORMATION_TYPES,
     )
 
 # =========================
@@ -2948,15 +4422,13 @@ def phone_missing_details_text(t: Dict[str, Any], training_type: str) -> str:
     for d in (t.get("documents") or []):
         key = (d.get("key") or "").strip()
         label = (d.get("label") or "Document").strip()
-        st = (d.get("status") or "").strip().upper()
+        st = d.get("status")
 
         # permis optionnel si no_permis
         if tt == "A3P" and key == "permis" and no_permis:
             continue
 
-        if st != "CONFORME":
-            if not st:
-                st = "NON DÉPOSÉ"
+        if st != DOC_STATUS_CONFORME:
             docs_lines.append(f"- {label} : {st}")
 
     docs_txt = "\n".join(docs_lines) if docs_lines else "- Aucun (selon statuts actuels)"
@@ -2976,14 +4448,14 @@ def _find_session_and_trainee(data: Dict[str, Any], session_id: str, trainee_id:
     if not s:
         return None, None
     trainees = _session_trainees_list(s)
-    t = next((x for x in trainees if x.get("id") == trainee_id), None)
+    t = find_trainee(s, trainee_id, trainees)
     return s, t
 
 
 @app.post("/api/sessions/<session_id>/stagiaires/<trainee_id>/phone-relance/send")
 @admin_login_required
 def api_phone_relance_send(session_id: str, trainee_id: str):
-    payload = request.get_json(silent=True) or {}
+    payload = request_json()
     admin_comment = (payload.get("comment") or "").strip()
 
     data = load_data()
@@ -2998,7 +4470,7 @@ def api_phone_relance_send(session_id: str, trainee_id: str):
     missing_details = phone_missing_details_text(t, training_type)
 
     # Token unique pour les actions secrétaire
-    followup_token = uuid.uuid4().hex
+    followup_token = secrets.token_hex(16)
     followup_id = "PHN-" + followup_token[:10].upper()
 
     # Enregistre la demande
@@ -3076,28 +4548,33 @@ def api_phone_relance_send(session_id: str, trainee_id: str):
     return jsonify({"ok": True, "email_ok": bool(ok), "followup_id": followup_id})
 
 
+# ✅ index token de relance -> (session, stagiaire, demande), reconstruit seulement après une modification
+_FOLLOWUP_IDX: Dict[str, Any] = {"data": None, "version": -1, "by_token": {}}
+
+
+def find_phone_followup(data: Dict[str, Any], token: str):
+    with _LOCK:
+        if _FOLLOWUP_IDX["data"] is not data or _FOLLOWUP_IDX["version"] != _DATA_VERSION:
+            by_token = {}
+            for s in data.get("sessions", []) or []:
+                for t in (s.get("trainees") or []):
+                    for it in (t.get("phone_followups") or []):
+                        tok = (it.get("token") or "").strip()
+                        if tok:
+                            by_token.setdefault(tok, (s, t, it))
+            _FOLLOWUP_IDX["data"] = data
+            _FOLLOWUP_IDX["version"] = _DATA_VERSION
+            _FOLLOWUP_IDX["by_token"] = by_token
+        return _FOLLOWUP_IDX["by_token"].get(token, (None, None, None))
+
+
 @app.get("/phone-followup/<token>")
 def phone_followup_page(token: str):
     # page publique "action secrétaire" (sans login), basée sur un token unique
     action = (request.args.get("action") or "").strip()  # called / no_answer
 
     data = load_data()
-    found = None
-    found_session_id = None
-    found_trainee_id = None
-
-    for s in data.get("sessions", []) or []:
-        for t in (s.get("trainees") or []):
-            for it in (t.get("phone_followups") or []):
-                if (it.get("token") or "").strip() == token:
-                    found = it
-                    found_session_id = s.get("id")
-                    found_trainee_id = t.get("id")
-                    break
-            if found:
-                break
-        if found:
-            break
+    _, _, found = find_phone_followup(data, token)
 
     if not found:
         return "<h3>Lien invalide ou expiré.</h3>", 404
@@ -3121,23 +4598,7 @@ def phone_followup_reply(token: str):
         return "<h3>Action invalide.</h3>", 400
 
     data = load_data()
-
-    s_found = None
-    t_found = None
-    entry_found = None
-
-    for s in data.get("sessions", []) or []:
-        for t in (s.get("trainees") or []):
-            for it in (t.get("phone_followups") or []):
-                if (it.get("token") or "").strip() == token:
-                    s_found = s
-                    t_found = t
-                    entry_found = it
-                    break
-            if entry_found:
-                break
-        if entry_found:
-            break
+    s_found, t_found, entry_found = find_phone_followup(data, token)
 
     if not entry_found:
         return "<h3>Lien invalide ou expiré.</h3>", 404
@@ -3145,7 +4606,7 @@ def phone_followup_reply(token: str):
     # on enregistre la réponse comme un nouvel événement (historique)
     t_found.setdefault("phone_followups", [])
     t_found["phone_followups"].insert(0, {
-        "id": "PHN-REP-" + uuid.uuid4().hex[:8].upper(),
+        "id": "PHN-REP-" + secrets.token_hex(4).upper(),
         "type": "RÉPONSE SECRÉTAIRE",
         "at": _now_iso(),
         "details": ("✅ Appelé" if outcome == "CALLED" else "❌ Pas pu joindre"),
@@ -3364,10 +4825,7 @@ def api_sst_bulk_upload(session_id: str):
                 f"(Aide : 04 22 47 07 68)"
             )
 
-            if (trainee.get("email") or "").strip():
-                brevo_send_email(trainee.get("email",""), subject, html)
-            if (trainee.get("phone") or "").strip():
-                brevo_send_sms(trainee.get("phone",""), sms)
+            notify_email_and_sms(trainee.get("email",""), subject, html, trainee.get("phone",""), sms)
 
         except Exception as e:
             print("=== BULK SST: erreur envoi mail/sms ===", repr(e))
@@ -3613,10 +5071,7 @@ def api_diplome_bulk_upload(session_id: str):
                 f"(Aide : 04 22 47 07 68)"
             )
 
-            if (trainee.get("email") or "").strip():
-                brevo_send_email(trainee.get("email", ""), subject, html)
-            if (trainee.get("phone") or "").strip():
-                brevo_send_sms(trainee.get("phone", ""), sms)
+            notify_email_and_sms(trainee.get("email", ""), subject, html, trainee.get("phone", ""), sms)
 
         except Exception as e:
             print("=== BULK DIPLOME: erreur envoi mail/sms ===", repr(e))
@@ -3724,10 +5179,7 @@ def api_attestation_bulk_upload(session_id: str):
                 f"votre {label} est disponible sur votre espace : {link} (Aide : 04 22 47 07 68)"
             )
 
-            if (trainee.get("email") or "").strip():
-                brevo_send_email(trainee.get("email",""), subject, html)
-            if (trainee.get("phone") or "").strip():
-                brevo_send_sms(trainee.get("phone",""), sms)
+            notify_email_and_sms(trainee.get("email",""), subject, html, trainee.get("phone",""), sms)
 
         except Exception as e:
             print("=== BULK ATTESTATION: erreur envoi mail/sms ===", repr(e))
@@ -3750,5 +5202,38 @@ def admin_sessions_slash_redirect():
 
 
 
+# =========================
+# Templates : compilés une fois au démarrage
+# =========================
+
+def _precompile_templates() -> None:
+    """Compile tous les templates HTML au chargement du module (le 1er visiteur ne paie pas la compilation)."""
+    for name in app.jinja_env.list_templates(filter_func=lambda n: n.endswith(".html")):
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            print("[TEMPLATES] compile error", name, repr(e))
+
+
+_precompile_templates()
+load_data()  # ✅ lecture + migration de data.json au démarrage (pas au 1er visiteur)
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
+    import signal
+    import sys
+
+    # ✅ SIGTERM (arrêt du conteneur) -> sortie normale, donc atexit : rien de perdu en mémoire
+    # (sous Gunicorn, c'est le hook worker_exit de gunicorn.conf.py qui s'en charge)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    debug = os.environ.get("FLASK_DEBUG", "0") == "1"
+    # ✅ avec le reloader, seul le process enfant (WERKZEUG_RUN_MAIN) sert les requêtes : lui seul rejoue l'outbox
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        replay_outbox()
+    # ✅ Serveur de dev uniquement — en production : gunicorn -c gunicorn.conf.py app:app
+    app.run(
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 5000)),
+        debug=debug,
+        threaded=True,
+    )
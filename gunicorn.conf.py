@@ -0,0 +1,34 @@
+# =========================
+# Gunicorn (production)
+# =========================
+# ✅ Un seul worker : le store data.json est gardé en mémoire dans le process
+#    (écritures via le thread writer). Plusieurs workers écraseraient le fichier.
+# ✅ La concurrence vient des threads (gthread) : les appels Brevo / CNAPS /
+#    hébergement bloquent sur le réseau, pas sur le CPU.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 20
+keepalive = 5
+
+
+def post_worker_init(worker):
+    # ✅ envois restés dans l'outbox (arrêt avant envoi) : rejoués une fois, par le worker qui sert les requêtes
+    import sys
+
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.replay_outbox()
+
+
+def worker_exit(server, worker):
+    # ✅ arrêt / redémarrage du worker (SIGTERM) : files d'envoi + data.json écrits avant de sortir
+    import sys
+
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.flush_pending_work()